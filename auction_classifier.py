@@ -0,0 +1,163 @@
+from functools import cached_property
+
+import exotics
+import nbt_reader
+import timestamps
+
+RARE_UNOBTAINABLE_ITEMS = frozenset(['REINFORCED_IRON_ARROW', 'GOLD_TIPPED_ARROW', 'REDSTONE_TIPPED_ARROW', 'EMERALD_TIPPED_ARROW', 'BOUNCY_ARROW', 'ICY_ARROW', 'ARMORSHRED_ARROW', 'EXPLOSIVE_ARROW', 'GLUE_ARROW', 'NANSORB_ARROW'])
+OG_REFORGE_LIST = frozenset(["godly", "unpleasant", "keen", "superior", "forceful", "hurtful", "demonic", "strong", "zealous"])
+DUNGEON_ITEM_LIST = frozenset(["ROTTEN_HELMET", "ROTTEN_CHESTPLATE", "ROTTEN_LEGGINGS", "ROTTEN_BOOTS", "ZOMBIE_SOLDIER_HELMET", "ZOMBIE_SOLDIER_CHESTPLATE", "ZOMBIE_SOLDIER_LEGGINGS", "ZOMBIE_SOLDIER_BOOTS", "ZOMBIE_KNIGHT_HELMET", "ZOMBIE_KNIGHT_CHESTPLATE", "ZOMBIE_KNIGHT_LEGGINGS", "ZOMBIE_KNIGHT_BOOTS", "ZOMBIE_COMMANDER_HELMET", "ZOMBIE_COMMANDER_CHESTPLATE", "ZOMBIE_COMMANDER_LEGGINGS", "ZOMBIE_COMMANDER_BOOTS", "ZOMBIE_LORD_HELMET", "ZOMBIE_LORD_CHESTPLATE", "ZOMBIE_LORD_LEGGINGS", "ZOMBIE_LORD_BOOTS", "HEAVY_HELMET", "HEAVY_CHESTPLATE", "HEAVY_LEGGINGS", "HEAVY_BOOTS", "SUPER_HEAVY_HELMET", "SUPER_HEAVY_CHESTPLATE", "SUPER_HEAVY_LEGGINGS", "SUPER_HEAVY_BOOTS", "SKELETON_GRUNT_HELMET", "SKELETON_GRUNT_CHESTPLATE", "SKELETON_GRUNT_LEGGINGS", "SKELETON_GRUNT_BOOTS", "SKELETON_SOLDIER_HELMET", "SKELETON_SOLDIER_CHESTPLATE", "SKELETON_SOLDIER_LEGGINGS", "SKELETON_SOLDIER_BOOTS", "SKELETON_MASTER_HELMET", "SKELETON_MASTER_CHESTPLATE", "SKELETON_MASTER_LEGGINGS", "SKELETON_MASTER_BOOTS", "SKELETON_LORD_HELMET", "SKELETON_LORD_CHESTPLATE", "SKELETON_LORD_LEGGINGS", "SKELETON_LORD_BOOTS", "BOUNCY_HELMET", "BOUNCY_CHESTPLATE", "BOUNCY_LEGGINGS", "BOUNCY_BOOTS", "SKELETOR_HELMET", "SKELETOR_CHESTPLATE", "SKELETOR_LEGGINGS", "SKELETOR_BOOTS", "SNIPER_HELMET", "ZOMBIE_SOLDIER_CUTLASS", "ZOMBIE_KNIGHT_SWORD", "ZOMBIE_COMMANDER_WHIP", "CRYPT_DREADLORD_SWORD", "CRYPT_BOW", "MACHINE_GUN_BOW", "SNIPER_BOW", "CONJURING_SWORD", "EARTH_SHARD", "SILENT_DEATH", "ICE_SPRAY_WAND"])
+
+SEYMOUR_ITEM_IDS = frozenset(('VELVET_TOP_HAT', "CASHMERE_JACKET", "SATIN_TROUSERS", "OXFORD_SHOES"))
+CRAB_HAT_IDS = frozenset(('PARTY_HAT_CRAB', 'PARTY_HAT_CRAB_ANIMATED'))
+CRAB_HAT_YEARS = frozenset(("2021", "2023"))
+MIDAS_IDS = frozenset(('MIDAS_SWORD', 'MIDAS_STAFF'))
+ADMIN_ORIGIN_TAGS = frozenset(("ITEM_MENU", "ITEM_COMMAND"))
+LEATHER_MINECRAFT_IDS = frozenset((298, 299, 300, 301))
+SEYMOUR_PIECE = "seymour piece"
+MUSEUM_CANDIDATE = "museum candidate"
+
+
+def make_hit(reason, item_id, auction, nbt_data, extra_data=None):
+    # everything the main process needs to act on a find, without the raw item bytes
+    return {
+        "reason": reason,
+        "item_id": item_id,
+        "auction": {x: y for x, y in auction.items() if x != 'item_bytes'},
+        "nbt": nbt_data,
+        "extra": extra_data
+    }
+
+
+class AuctionContext:
+    # one decoded auction, anything more than one rule needs is worked out once on first use
+    def __init__(self, auction, nbt_data, attributes):
+        self.auction = auction
+        self.nbt_data = nbt_data
+        self.attributes = attributes
+        self.item_id = attributes["id"]
+        self.minecraft_id = nbt_data["i"][0]["id"]
+
+    @cached_property
+    def hex_code(self):
+        return hex(self.nbt_data["i"][0]["tag"]["display"]["color"]).replace("0x", "").upper().rjust(6, '0')
+
+    @cached_property
+    def museum_timestamp(self):
+        return timestamps.timestamp_to_museum_unix(str(self.attributes["timestamp"]), use_dst=False)
+
+    @cached_property
+    def exotic_type(self):
+        return exotics.get_exotic_type(self.nbt_data)
+
+
+class Rule:
+    # reason and extra can be callables taking the AuctionContext. a rule only runs when the item_id is in item_ids,
+    # the minecraft id is in minecraft_ids, every required key is in ExtraAttributes and no absent key is
+    def __init__(self, reason, item_ids=None, minecraft_ids=None, required_keys=(), absent_keys=(), predicate=None,
+                 extra=None):
+        self.reason = reason
+        self.item_ids = frozenset(item_ids) if item_ids is not None else None
+        self.minecraft_ids = frozenset(minecraft_ids) if minecraft_ids is not None else None
+        self.required_keys = frozenset(required_keys)
+        self.absent_keys = frozenset(absent_keys)
+        self.predicate = predicate
+        self.extra = extra
+        self.order = 0
+
+    def matches(self, context):
+        # the index already checked item_ids, everything else is cheap enough to check again
+        if self.minecraft_ids is not None and context.minecraft_id not in self.minecraft_ids:
+            return False
+        if not self.required_keys <= context.attributes.keys():
+            return False
+        if not self.absent_keys.isdisjoint(context.attributes):
+            return False
+        return self.predicate is None or self.predicate(context)
+
+    def make_hit(self, context):
+        reason = self.reason(context) if callable(self.reason) else self.reason
+        extra_data = self.extra(context) if self.extra is not None else None
+        return make_hit(reason, context.item_id, context.auction, context.nbt_data, extra_data)
+
+
+class RuleIndex:
+    # rules are bucketed by item_id, then minecraft id, then a required key, so an auction is only checked against
+    # rules that could match it. hits come out in the order the rules were registered
+    def __init__(self, rules):
+        self.by_item_id = {}
+        self.by_minecraft_id = {}
+        self.by_key = {}
+        self.unindexed = []
+        for order, rule in enumerate(rules):
+            rule.order = order
+            if rule.item_ids is not None:
+                for item_id in rule.item_ids:
+                    self.by_item_id.setdefault(item_id, []).append(rule)
+            elif rule.minecraft_ids is not None:
+                for minecraft_id in rule.minecraft_ids:
+                    self.by_minecraft_id.setdefault(minecraft_id, []).append(rule)
+            elif rule.required_keys:
+                self.by_key.setdefault(min(rule.required_keys), []).append(rule)
+            else:
+                self.unindexed.append(rule)
+        self.indexed_keys = frozenset(self.by_key)
+
+    def candidates(self, context):
+        candidates = self.unindexed + self.by_item_id.get(context.item_id, []) + \
+            self.by_minecraft_id.get(context.minecraft_id, [])
+        for key in self.indexed_keys.intersection(context.attributes):
+            candidates += self.by_key[key]
+        candidates.sort(key=lambda x: x.order)
+        return candidates
+
+    def evaluate(self, context):
+        return [rule.make_hit(context) for rule in self.candidates(context) if rule.matches(context)]
+
+
+# order here is the order hits get sent in
+RULES = [
+    Rule(SEYMOUR_PIECE, item_ids=SEYMOUR_ITEM_IDS, extra=lambda x: x.hex_code),
+    Rule("2023 crab hat", item_ids=CRAB_HAT_IDS, required_keys=("party_hat_year",),
+         predicate=lambda x: x.attributes["party_hat_year"] and str(x.attributes["party_hat_year"]) in CRAB_HAT_YEARS),
+    Rule("funny jax arrow", item_ids=RARE_UNOBTAINABLE_ITEMS),
+    Rule("cool kid salmon hat", item_ids=("SALMON_HAT",), absent_keys=("raffle_win",)),
+    Rule("cheapskate midas", item_ids=MIDAS_IDS, required_keys=("winning_bid",),
+         predicate=lambda x: x.attributes["winning_bid"] < 1000000),
+    Rule("no bid midas gaming", item_ids=MIDAS_IDS, absent_keys=("winning_bid",)),
+    Rule("clean dungeons drop", item_ids=DUNGEON_ITEM_LIST, absent_keys=("baseStatBoostPercentage", "item_tier")),
+    Rule("0% dungeons drop", item_ids=DUNGEON_ITEM_LIST, required_keys=("item_tier",),
+         absent_keys=("baseStatBoostPercentage",)),
+    Rule(lambda x: f"{x.attributes['modifier']} reforge", required_keys=("modifier",),
+         predicate=lambda x: str(x.attributes["modifier"]) in OG_REFORGE_LIST and x.auction['category'] != "accessories"),
+    Rule("admin-spawned item", required_keys=("originTag",),
+         predicate=lambda x: str(x.attributes["originTag"]) in ADMIN_ORIGIN_TAGS),
+    Rule("glitched timestamp", required_keys=("timestamp",),
+         predicate=lambda x: x.attributes["timestamp"] and x.museum_timestamp[1]),
+    Rule(MUSEUM_CANDIDATE, required_keys=("timestamp",), predicate=lambda x: x.attributes["timestamp"],
+         extra=lambda x: x.museum_timestamp[0]),
+    Rule("epic exotic", minecraft_ids=LEATHER_MINECRAFT_IDS, predicate=lambda x: x.exotic_type != "DEFAULT",
+         extra=lambda x: x.exotic_type),
+]
+RULE_INDEX = RuleIndex(RULES)
+
+
+def classify_auctions(auctions):
+    # runs in worker processes when decode_processes is set, so no side effects in here
+    hits = []
+    for auction in auctions:
+        hits += classify_auction(auction)
+    return hits
+
+
+def classify_auction(auction):
+    try:
+        nbt_data = nbt_reader.read_item_bytes(auction['item_bytes'])
+    except ValueError:
+        return []
+
+    attributes = nbt_data["i"][0]["tag"].get("ExtraAttributes")
+    if not attributes:
+        return []
+
+    return RULE_INDEX.evaluate(AuctionContext(auction, nbt_data, attributes))
@@ -0,0 +1,457 @@
+import argparse
+import base64
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import count
+from urllib.parse import parse_qs, urlsplit
+
+import nbt_reader
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(REPO_DIR, "benchmark_baseline.json")
+SHARED_FILES = ("default_hexes.json", "a", "lab_table.f32", "nearest_pieces.u8")
+DEFAULT_TOLERANCE = 0.25
+
+SEYMOUR_SLOTS = {"VELVET_TOP_HAT": 298, "CASHMERE_JACKET": 299, "SATIN_TROUSERS": 300, "OXFORD_SHOES": 301}
+COMMON_ITEMS = ["HYPERION", "ASPECT_OF_THE_END", "TERMINATOR", "JUJU_SHORTBOW", "ENCHANTED_BOOK", "SHADOW_FURY",
+                "GIANTS_SWORD", "NECRON_HELMET", "STORM_CHESTPLATE", "GOLDOR_LEGGINGS", "BONZO_MASK", "GRAPPLING_HOOK",
+                "ASPECT_OF_THE_DRAGON", "MIDAS_SWORD", "ROTTEN_HELMET", "SKELETON_LORD_BOOTS", "SALMON_HAT",
+                "PARTY_HAT_CRAB", "DIVAN_DRILL", "TITANIUM_DRILL", "PET", "POWER_WITHER_CHESTPLATE"]
+REFORGES = ["fabled", "withered", "heroic", "spiritual", "renowned", "ancient", "giant", "precise", "warped", "sharp"]
+ENCHANTS = ["sharpness", "critical", "ender_slayer", "giant_killer", "looting", "scavenger", "vampirism", "luck",
+            "ultimate_wise", "protection", "growth", "rejuvenate", "first_strike", "smite", "bane_of_arthropods"]
+CATEGORIES = ["weapon", "armor", "accessories", "consumables", "blocks", "misc"]
+TIERS = ["COMMON", "UNCOMMON", "RARE", "EPIC", "LEGENDARY", "MYTHIC"]
+SEYMOUR_RATE = 0.003  # share of ah listings that are seymour pieces
+LEATHER_RATE = 0.12
+
+
+def nbt_payload(tag_type, value):
+    # values are (tag type, payload) pairs, lists are (TAG_LIST, (item type, [payloads]))
+    scalar = nbt_reader.SCALAR_STRUCTS.get(tag_type)
+    if scalar is not None:
+        return scalar.pack(value)
+    if tag_type == nbt_reader.TAG_STRING:
+        encoded = value.encode()
+        return nbt_reader.UNSIGNED_SHORT.pack(len(encoded)) + encoded
+    if tag_type == nbt_reader.TAG_LIST:
+        item_type, items = value
+        return struct.pack(">bi", item_type, len(items)) + b"".join(nbt_payload(item_type, x) for x in items)
+    if tag_type == nbt_reader.TAG_COMPOUND:
+        return b"".join(struct.pack(">bH", child_type, len(name.encode())) + name.encode() +
+                        nbt_payload(child_type, child) for name, (child_type, child) in value.items()) + b"\0"
+    raise ValueError(f"can't encode tag type {tag_type}")
+
+
+def encode_items(items):
+    # same wrapping as item_bytes and inventory data: base64(gzip(root compound {"i": [items]}))
+    root = {"i": (nbt_reader.TAG_LIST, (nbt_reader.TAG_COMPOUND, items))}
+    data = b"\x0a\x00\x00" + nbt_payload(nbt_reader.TAG_COMPOUND, root)
+    return base64.b64encode(gzip.compress(data)).decode()
+
+
+def string(value):
+    return nbt_reader.TAG_STRING, value
+
+
+def compound(value):
+    return nbt_reader.TAG_COMPOUND, value
+
+
+def integer(value):
+    return nbt_reader.TAG_INT, value
+
+
+def random_uuid(rnd, dashed=False):
+    value = "%032x" % rnd.getrandbits(128)
+    return f"{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}" if dashed else value
+
+
+def random_timestamp(rnd):
+    # almost all "MM/DD/YY HH:MM AM", the odd glitched 24h one and the odd unix ms one, all strings like on the ah
+    roll = rnd.random()
+    date = datetime(2019, 6, 11) + timedelta(minutes=rnd.randrange(4 * 365 * 24 * 60))
+    if roll < 0.97:
+        return string(date.strftime("%m/%d/%y %I:%M %p"))
+    if roll < 0.99:
+        return string(f"{date.month + 12:02d}/{date.day:02d}/{date.year % 100:02d} {date.strftime('%H:%M')}")
+    return string(str(int(date.timestamp() * 1000)))
+
+
+def make_item(rnd, item_id, minecraft_id, color=None, seymour=False):
+    attributes = {"id": string(item_id), "uuid": string(random_uuid(rnd, dashed=True))}
+    if seymour or rnd.random() < 0.85:
+        attributes["timestamp"] = random_timestamp(rnd)
+    if not seymour:
+        if rnd.random() < 0.5:
+            attributes["modifier"] = string(rnd.choice(REFORGES))
+        if rnd.random() < 0.6:
+            attributes["enchantments"] = compound({x: integer(rnd.randrange(1, 8)) for x in rnd.sample(ENCHANTS, 5)})
+        if rnd.random() < 0.3:
+            attributes["hot_potato_count"] = integer(rnd.randrange(16))
+        if rnd.random() < 0.2:
+            attributes["gems"] = compound({"JASPER_0": string("PERFECT"), "unlocked_slots": (
+                nbt_reader.TAG_LIST, (nbt_reader.TAG_STRING, ["JASPER_0", "COMBAT_0"]))})
+        if item_id == "MIDAS_SWORD" and rnd.random() < 0.9:
+            attributes["winning_bid"] = nbt_reader.TAG_LONG, rnd.randrange(1000000, 100000000)
+        if item_id == "PARTY_HAT_CRAB":
+            attributes["party_hat_year"] = integer(2022)
+        if item_id == "SALMON_HAT":
+            attributes["raffle_win"] = integer(1)
+        if item_id in ("ROTTEN_HELMET", "SKELETON_LORD_BOOTS"):
+            attributes["baseStatBoostPercentage"] = nbt_reader.TAG_BYTE, rnd.randrange(40, 51)
+    lore = [f"§7Damage: §c+{rnd.randrange(500)} §8(+{rnd.randrange(50)})" for _ in range(rnd.randrange(6, 24))]
+    display = {"Lore": (nbt_reader.TAG_LIST, (nbt_reader.TAG_STRING, lore)),
+               "Name": string(f"§6{item_id.replace('_', ' ').title()}")}
+    if color is not None:
+        display["color"] = integer(color)
+    tag = {"Unbreakable": (nbt_reader.TAG_BYTE, 1), "HideFlags": integer(254), "display": compound(display),
+           "ExtraAttributes": compound(attributes)}
+    return {"id": (nbt_reader.TAG_SHORT, minecraft_id), "Count": (nbt_reader.TAG_BYTE, 1), "tag": compound(tag),
+            "Damage": (nbt_reader.TAG_SHORT, 0)}
+
+
+def random_listing_item(rnd, default_hexes):
+    roll = rnd.random()
+    if roll < SEYMOUR_RATE:
+        item_id = rnd.choice(list(SEYMOUR_SLOTS))
+        return make_item(rnd, item_id, SEYMOUR_SLOTS[item_id], color=rnd.randrange(1 << 24), seymour=True)
+    if roll < SEYMOUR_RATE + LEATHER_RATE:
+        slot = rnd.choice(list(SEYMOUR_SLOTS))
+        item_id = rnd.choice(list(default_hexes[slot]))
+        color = int(default_hexes[slot][item_id]['hex'], 16)
+        if rnd.random() < 0.02:  # the odd exotic
+            color = rnd.randrange(1 << 24)
+        return make_item(rnd, item_id, SEYMOUR_SLOTS[slot], color=color)
+    return make_item(rnd, rnd.choice(COMMON_ITEMS), rnd.choice((276, 261, 397, 403, 278)))
+
+
+def make_auction(rnd, item, sellers, now):
+    start = now - rnd.randrange(14 * 24 * 60 * 60 * 1000)
+    bin_auction = rnd.random() < 0.8
+    return {
+        "uuid": random_uuid(rnd), "auctioneer": rnd.choice(sellers), "profile_id": random_uuid(rnd),
+        "coop": [], "start": start, "end": start + 48 * 60 * 60 * 1000,
+        "item_name": item["tag"][1]["display"][1]["Name"][1][2:], "item_lore": "\n".join(
+            item["tag"][1]["display"][1]["Lore"][1][1]),
+        "extra": "", "category": rnd.choice(CATEGORIES), "tier": rnd.choice(TIERS),
+        "starting_bid": rnd.randrange(1, 2000000000), "item_bytes": encode_items([item]), "claimed": False,
+        "claimed_bidders": [], "highest_bid_amount": 0 if bin_auction else rnd.randrange(1000000),
+        "last_updated": start, "bin": bin_auction, "bids": [], "item_uuid": random_uuid(rnd),
+    }
+
+
+def make_inventory(rnd, slots, seymour_pieces, default_hexes):
+    items = [{} for _ in range(slots)]
+    for slot in rnd.sample(range(slots), min(slots, rnd.randrange(slots // 2, slots + 1))):
+        items[slot] = random_listing_item(rnd, default_hexes)
+    for slot, (item_id, color) in zip(rnd.sample(range(slots), len(seymour_pieces)), seymour_pieces):
+        items[slot] = make_item(rnd, item_id, SEYMOUR_SLOTS[item_id], color=color, seymour=True)
+    return {"type": 0, "data": encode_items(items)}
+
+
+def make_profile(rnd, uuid, default_hexes):
+    # one member, one profile, seymour pieces scattered around a third of them
+    pieces = []
+    if rnd.random() < 0.35:
+        pieces = [(rnd.choice(list(SEYMOUR_SLOTS)), rnd.randrange(1 << 24)) for _ in range(rnd.randrange(1, 9))]
+    menus = {"inv_contents": 36, "inv_armor": 4, "wardrobe_contents": 36, "ender_chest_contents": 45,
+             "personal_vault_contents": 27}
+    holders = [rnd.choice(list(menus) + ["backpack"]) for _ in pieces]
+    member = {}
+    for menu, slots in menus.items():
+        member[menu] = make_inventory(rnd, slots, [x for x, y in zip(pieces, holders) if y == menu], default_hexes)
+    backpack_pieces = [x for x, y in zip(pieces, holders) if y == "backpack"]
+    member["backpack_contents"] = {str(i): make_inventory(rnd, 27, backpack_pieces if i == 0 else [], default_hexes)
+                                   for i in range(rnd.randrange(2, 10))}
+    return {"success": True, "profiles": [{"profile_id": random_uuid(rnd), "members": {uuid: member}}]}
+
+
+def make_i_tem_player(rnd):
+    items = []
+    for _ in range(rnd.randrange(0, 4)):
+        item_id = rnd.choice(list(SEYMOUR_SLOTS))
+        items.append({"itemId": item_id, "_id": random_uuid(rnd, dashed=True), "colour": "%06X" % rnd.randrange(1 << 24),
+                      "lastChecked": int(time.time() * 1000) - rnd.randrange(10 ** 10),
+                      "location": f"backpack-{rnd.randrange(18)}"})
+    return {"success": True, "items": items}
+
+
+def synthesise_fixtures(pages=10, auctions_per_page=1000, profiles=20, seed=0):
+    rnd = random.Random(seed)
+    with open(os.path.join(REPO_DIR, "default_hexes.json"), "r") as r:
+        default_hexes = json.load(r)
+    now = 1700000000000
+    sellers = [random_uuid(rnd) for _ in range(max(pages * auctions_per_page // 20, 1))]
+    auction_pages = []
+    for page in range(pages):
+        auctions = [make_auction(rnd, random_listing_item(rnd, default_hexes), sellers, now)
+                    for _ in range(auctions_per_page)]
+        auction_pages.append({"success": True, "page": page, "totalPages": pages,
+                              "totalAuctions": pages * auctions_per_page, "lastUpdated": now, "auctions": auctions})
+    # profile owners are the sellers, so dupe lookups on seymour listings hit a real profile
+    owners = rnd.sample(sellers, min(profiles, len(sellers)))
+    return {
+        "auction_pages": auction_pages,
+        "profiles": {x: make_profile(rnd, x, default_hexes) for x in owners},
+        "i_tem": {x: make_i_tem_player(rnd) for x in owners},
+    }
+
+
+def load_fixtures(path):
+    # captured fixtures use the same shape: {"auction_pages": [...], "profiles": {uuid: ...}, "i_tem": {uuid: ...}}
+    with (gzip.open if path.endswith(".gz") else open)(path, "rt") as r:
+        return json.load(r)
+
+
+def save_fixtures(fixtures, path):
+    with (gzip.open if path.endswith(".gz") else open)(path, "wt") as w:
+        json.dump(fixtures, w)
+
+
+def stub_response(fixtures, method, url, data):
+    # offline stand-in for hypixel, mojang, iTEM and github
+    parts = urlsplit(url)
+    path = parts.path
+    query = parse_qs(parts.query)
+    if path.endswith("itemHash.json"):
+        return {x: x for x in COMMON_ITEMS + list(SEYMOUR_SLOTS) + ["DIRT"]}
+    if path.endswith("images.json"):
+        return {x: {"normal": f"https://example.invalid/{x.lower()}.png"} for x in COMMON_ITEMS + list(SEYMOUR_SLOTS) + ["DIRT"]}
+    if path.endswith("/skyblock/auctions"):
+        pages = fixtures["auction_pages"]
+        page = int(query.get("page", ["0"])[0])
+        return pages[page] if page < len(pages) else {"success": False}
+    if path.endswith("/skyblock/profiles"):
+        return fixtures["profiles"].get(query["uuid"][0], {"success": True, "profiles": None})
+    if path.startswith("/items/player/"):
+        return fixtures["i_tem"].get(path.rsplit("/", 1)[1], {"success": True, "items": []})
+    if path == "/items/position":
+        items = json.loads(data)["items"]
+        return {"positions": [{"itemId": x["itemId"], "creation": x["creation"],
+                               "highest": int(hashlib.md5(f"{x['itemId']}{x['creation']}".encode()).hexdigest()[:4], 16)}
+                              for x in items]}
+    if path.startswith("/items/"):
+        return {"success": False}
+    if parts.hostname in ("api.mojang.com", "api.ashcon.app"):
+        name_or_uuid = path.rsplit("/", 1)[1]
+        if len(name_or_uuid) >= 32:
+            return {"name": f"player_{name_or_uuid[:6]}", "id": name_or_uuid.replace("-", "")}
+        return {"name": name_or_uuid, "id": hashlib.md5(name_or_uuid.lower().encode()).hexdigest()}
+    return None
+
+
+def install_stubs(fixtures):
+    import http_client
+    import webhooks
+
+    async def request_json(self, method, url, data=None, endpoint=None):
+        return stub_response(fixtures, method, url, data)
+
+    async def request_revalidated(self, url, etag=None, last_modified=None):
+        return 200, stub_response(fixtures, "GET", url, None), None, None
+
+    message_ids = count(1)
+
+    def send_batch(self, url, batch):
+        self.build_webhook(url, batch)  # still pay for building the embeds, just don't send them
+        message_id = next(message_ids)
+        for message in batch:
+            message.message_id = message_id
+        return len(batch)
+
+    http_client.HttpClient.request_json = request_json
+    http_client.HttpClient.request_revalidated = request_revalidated
+    webhooks.WebhookDispatcher.send_batch = send_batch
+
+
+def enter_scratch_dir():
+    # main.py and the database default to paths in the working directory, so run in a throwaway copy of it
+    scratch = tempfile.mkdtemp(prefix="seymour-bench-")
+    for name in SHARED_FILES:
+        source = os.path.join(REPO_DIR, name)
+        if os.path.exists(source):
+            os.symlink(source, os.path.join(scratch, name))
+    os.chdir(scratch)
+    return scratch
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def measure(unit, calls):
+    # calls are (function, units it covers), every call is timed on its own
+    latencies = []
+    units = 0
+    for function, call_units in calls:
+        start = time.perf_counter_ns()
+        function()
+        latencies.append(time.perf_counter_ns() - start)
+        units += call_units
+    total = sum(latencies) / 1e9
+    latencies.sort()
+    return {
+        "unit": unit, "count": units, "seconds": total, "rate": units / total if total else 0.0,
+        "p50_ms": percentile(latencies, 0.5) / 1e6, "p99_ms": percentile(latencies, 0.99) / 1e6,
+    }
+
+
+def seymour_pieces_in(fixtures):
+    pieces = []
+    for page in fixtures["auction_pages"]:
+        for auction in page["auctions"]:
+            data = nbt_reader.read_item_bytes(auction["item_bytes"])
+            attributes = data["i"][0]["tag"].get("ExtraAttributes", {})
+            if attributes.get("id") in SEYMOUR_SLOTS:
+                pieces.append((attributes["id"], attributes["uuid"], "%06X" % data["i"][0]["tag"]["display"]["color"]))
+    return pieces
+
+
+def run_stages(fixtures, db_rows, seed):
+    import main
+
+    if not main.item_images:  # the scratch directory never has a startup snapshot
+        main.startup.revalidate_item_images(main.http)
+    rnd = random.Random(seed)
+    results = {}
+    auctions = [x for page in fixtures["auction_pages"] for x in page["auctions"]]
+
+    # database first, so the seymour listings later on have dupes to find
+    db = main.database.SeymourDatabase()
+    listed = seymour_pieces_in(fixtures)
+    rows = []
+    for i in range(db_rows):
+        if listed and i % 50 == 0:
+            item_id, _, hex_code = listed[(i // 50) % len(listed)]
+        else:
+            item_id, hex_code = rnd.choice(list(SEYMOUR_SLOTS)), "%06X" % rnd.randrange(1 << 24)
+        piece = main.SeymourPiece(item_id, random_uuid(rnd, dashed=True), hex_code)
+        owner = rnd.choice(list(fixtures["profiles"]) or [random_uuid(rnd)])
+        rows.append(main.SeymourPieceWithOwnership(piece, owner, "inv_contents", 1600000000 + i))
+    batches = [rows[i:i + 100] for i in range(0, len(rows), 100)]
+    results["sqlite add_items_to_db"] = measure("rows", [(lambda x=x: db.add_items_to_db(x), len(x)) for x in batches])
+    lookups = rnd.sample(rows, min(len(rows), 2000))
+    results["sqlite matching_hexes"] = measure("queries", [
+        (lambda x=x: db.matching_hexes(x.piece.hex_code, x.piece.item_uuid), 1) for x in lookups])
+    results["sqlite pieces_near_lab"] = measure("queries", [
+        (lambda x=x: db.pieces_near_lab(main.color.hex_to_lab(x.piece.hex_code), 3), 1) for x in lookups[:500]])
+
+    results["get_nbt_data"] = measure("auctions", [
+        (lambda x=x: main.AuctionScanner.get_nbt_data(x["item_bytes"]), 1) for x in auctions])
+
+    scanner = main.AuctionScanner()
+    results["find_items"] = measure("auctions", [
+        (lambda x=x: scanner.find_items(x), len(x["auctions"])) for x in fixtures["auction_pages"]])
+    main.webhook_dispatcher.join()
+
+    pieces = [main.SeymourPiece(item_id, item_uuid, hex_code) for item_id, item_uuid, hex_code in listed]
+    while len(pieces) < 2000:
+        item_id = rnd.choice(list(SEYMOUR_SLOTS))
+        pieces.append(main.SeymourPiece(item_id, random_uuid(rnd, dashed=True), "%06X" % rnd.randrange(1 << 24)))
+    results["find_closest_skyblock_piece"] = measure("pieces", [
+        (lambda x=x: main.find_closest_skyblock_piece(x, length=3), 1) for x in pieces])
+    main.render_armor_image.cache_clear()
+    results["create_armor_image"] = measure("pieces", [(lambda x=x: main.create_armor_image(x), 1) for x in pieces])
+
+    player_scanner = main.PlayerScanner()
+    seymour_lists = {}
+
+    def get_profile(uuid):
+        seymour_lists[uuid] = player_scanner.get_profile(uuid)
+
+    results["get_profile"] = measure("profiles", [(lambda x=x: get_profile(x), 1) for x in fixtures["profiles"]])
+    results["process_seymour_list"] = measure("pieces", [
+        (lambda x=x, y=y: player_scanner.process_seymour_list(dict(y), x), len(y))
+        for x, y in seymour_lists.items() if y])
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # rate ratio per stage against the baseline, and the stages that got slower by more than tolerance
+    changes, regressions = {}, []
+    for stage, result in results.items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or not previous["rate"]:
+            continue
+        changes[stage] = result["rate"] / previous["rate"]
+        if changes[stage] < 1 - tolerance:
+            regressions.append(stage)
+    return changes, regressions
+
+
+def print_report(results, changes):
+    print(f"{'stage':<30}{'count':>9}  {'rate':>20}{'p50':>11}{'p99':>11}  vs baseline")
+    for stage, result in results.items():
+        change = f"{(changes[stage] - 1) * 100:+.1f}%" if stage in changes else "-"
+        print(f"{stage:<30}{result['count']:>9}  {result['rate']:>12.1f} {result['unit'] + '/s':<10}"
+              f"{result['p50_ms']:>8.3f}ms{result['p99_ms']:>8.3f}ms  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays auction pages and profiles through the scanner offline.")
+    parser.add_argument("--fixtures", help="replay these fixtures (.json or .json.gz) instead of synthesising them")
+    parser.add_argument("--record", help="write the fixtures used to this path, to replay them later")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--auctions-per-page", type=int, default=1000)
+    parser.add_argument("--profiles", type=int, default=20)
+    parser.add_argument("--db-rows", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="exit with 1 if a stage's rate drops more than this fraction below the baseline")
+    parser.add_argument("--json", action="store_true", help="print the results as json instead of a table")
+    parser.add_argument("--verbose", action="store_true", help="don't hide the scanner's own output")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        fixtures = load_fixtures(args.fixtures)
+    else:
+        fixtures = synthesise_fixtures(args.pages, args.auctions_per_page, args.profiles, args.seed)
+    if args.record:
+        save_fixtures(fixtures, args.record)
+
+    install_stubs(fixtures)
+    sys.path.insert(0, REPO_DIR)
+    scratch = enter_scratch_dir()
+    output = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(output):
+        results = run_stages(fixtures, args.db_rows, args.seed)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as r:
+            baseline = json.load(r)
+    changes, regressions = compare(results, baseline, args.tolerance)
+    if args.json:
+        print(json.dumps({"stages": results, "changes": changes, "regressions": regressions}, indent=4))
+    else:
+        print_report(results, changes)
+        if regressions:
+            print(f"Slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as w:
+            json.dump({"created": datetime.now().isoformat(timespec="seconds"), "stages": results}, w, indent=4)
+        print(f"Saved baseline to {args.baseline}")
+    shutil.rmtree(scratch, ignore_errors=True)
+    sys.stdout.flush()
+    os._exit(1 if regressions and not args.save_baseline else 0)  # the scanner's daemon threads never finish
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import argparse
+import calendar
+import csv
+import gzip
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import color
+import database
+import startup_cache
+
+BATCH_SIZE = 20000  # rows per transaction and per checkpoint
+READ_SIZE = 1 << 20
+SEPARATORS = re.compile(r"[\s,]*")
+MONTHS = {x: i for i, x in enumerate(("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov",
+                                      "Dec"), 1)}
+
+
+def open_text(path):
+    # utf-8-sig because iTEM's csv exports start with a BOM, which otherwise ends up in the _id column name
+    return (gzip.open if path.endswith(".gz") else open)(path, "rt", encoding="utf-8-sig", newline="")
+
+
+def read_csv(path):
+    # everything is streamed, a reader never holds more than one batch of records
+    with open_text(path) as r:
+        reader = csv.reader(r)
+        header = next(reader, None)
+        if header is None:
+            return
+        for row in reader:
+            yield dict(zip(header, row))
+
+
+def read_json(path):
+    # a top level array of items, or one item per line
+    decoder = json.JSONDecoder()
+    with open_text(path) as r:
+        buffer, position = r.read(READ_SIZE), 0
+        position = SEPARATORS.match(buffer, position).end()
+        in_array = buffer.startswith("[", position)
+        if in_array:
+            position += 1
+        while True:
+            position = SEPARATORS.match(buffer, position).end()
+            if in_array and buffer.startswith("]", position):
+                return
+            try:
+                if position == len(buffer):
+                    raise json.JSONDecodeError("need more input", buffer, position)
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the item runs past what's been read so far
+                chunk = r.read(READ_SIZE)
+                if not chunk:
+                    if position < len(buffer):
+                        raise
+                    return
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            yield item
+
+
+def read_records(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".csv"):
+        return read_csv(path)
+    return read_json(path)
+
+
+def batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def field(record, name):
+    # csv exports flatten nested objects into "currentOwner.playerUuid", json keeps them nested
+    if name in record:
+        return record[name]
+    value = record
+    for part in name.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def parse_last_checked(value):
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+        value = int(value)
+        return value // 1000 if value > 10 ** 11 else value  # iTEM uses ms in some exports
+    # "Mon Jun 12 12:34:56 UTC 2023", what the csv exports have. strptime is most of the parsing time otherwise
+    parts = value.split()
+    if len(parts) == 6 and parts[4] == "UTC" and parts[1] in MONTHS:
+        hour, minute, second = parts[3].split(":")
+        return calendar.timegm((int(parts[5]), MONTHS[parts[1]], int(parts[2]), int(hour), int(minute), int(second)))
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def parse_colour(value):
+    # decimal in iTEM exports, but take hex too
+    if isinstance(value, int):
+        return value
+    value = str(value).strip().lstrip("#")
+    return int(value) if value.isdigit() else int(value, 16)
+
+
+def parse_batch(records, default_item_id):
+    # runs in the worker processes. returns rows in database.ROW_COLUMNS order and how many records were skipped
+    pieces = []
+    skipped = 0
+    for record in records:
+        try:
+            item_id = field(record, "itemId") or default_item_id
+            if item_id not in startup_cache.SEYMOUR_SLOTS:
+                skipped += 1
+                continue
+            rgb = parse_colour(field(record, "colour"))
+            item_uuid = field(record, "_id")
+            if not item_uuid or not 0 <= rgb <= 0xFFFFFF:
+                skipped += 1
+                continue
+            location = (field(record, "location") or "").replace("backpack-", "backpack_contents_")
+            pieces.append((item_id, item_uuid, field(record, "currentOwner.playerUuid") or None, location,
+                           parse_last_checked(field(record, "lastChecked")), f"{rgb:06X}", rgb))
+        except (TypeError, ValueError, AttributeError):
+            skipped += 1
+    labs = color.rgb_ints_to_lab_batch([x[6] for x in pieces]).tolist() if pieces else []
+    return [(*piece[:6], *lab, piece[6]) for piece, lab in zip(pieces, labs)], skipped
+
+
+def parsed_batches(records, default_item_id, workers, batch_size):
+    # parses up to workers + 1 batches ahead of the database, so memory stays at a few batches whatever the file size
+    if workers <= 1:
+        for batch in batches(records, batch_size):
+            yield len(batch), parse_batch(batch, default_item_id)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches(records, batch_size):
+            pending.append((len(batch), executor.submit(parse_batch, batch, default_item_id)))
+            if len(pending) > workers:
+                count, future = pending.popleft()
+                yield count, future.result()
+        while pending:
+            count, future = pending.popleft()
+            yield count, future.result()
+
+
+def checkpoint_path(path):
+    # records of the input already in the database. written after each batch commits, a crash in between only means
+    # that batch is upserted a second time, which changes nothing
+    return path + ".ingest.json"
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_checkpoint(path):
+    try:
+        with open(checkpoint_path(path)) as r:
+            checkpoint = json.load(r)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if checkpoint.get("file") != file_signature(path):
+        print(f"{path} changed since it was last imported, starting over")
+        return None
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    temp_path = checkpoint_path(path) + ".tmp"
+    with open(temp_path, "w") as w:
+        json.dump(checkpoint, w)
+    os.replace(temp_path, checkpoint_path(path))
+
+
+def guess_item_id(path):
+    # iTEM names its exports after the item, e.g. OXFORD_SHOES_0-81765.csv
+    name = os.path.basename(path)
+    for item_id in startup_cache.SEYMOUR_SLOTS:
+        if name.startswith(item_id):
+            return item_id
+    return None
+
+
+def ingest(path, db, item_id=None, workers=None, batch_size=BATCH_SIZE, restart=False):
+    checkpoint = None if restart else load_checkpoint(path)
+    if checkpoint is None:
+        checkpoint = {"file": file_signature(path), "records": 0, "pieces": 0, "skipped": 0, "done": False}
+    elif checkpoint["done"]:
+        print(f"{path} was already imported ({checkpoint['pieces']} pieces), --restart to import it again")
+        return checkpoint
+    elif checkpoint["records"]:
+        print(f"Resuming {path} after {checkpoint['records']} records")
+
+    records = read_records(path)
+    for _ in zip(range(checkpoint["records"]), records):
+        pass  # already imported
+    default_item_id = item_id or guess_item_id(path)
+    workers = os.cpu_count() if workers is None else workers
+
+    start_time = time.time()
+    start_records = checkpoint["records"]
+    for count, (rows, skipped) in parsed_batches(records, default_item_id, workers, batch_size):
+        if rows:
+            db.bulk_upsert(rows)
+        checkpoint["records"] += count
+        checkpoint["pieces"] += len(rows)
+        checkpoint["skipped"] += skipped
+        save_checkpoint(path, checkpoint)
+        rate = (checkpoint["records"] - start_records) / max(time.time() - start_time, 1e-9)
+        print(f"{path}: {checkpoint['records']} records, {checkpoint['pieces']} pieces, {rate:.0f} records/s")
+    checkpoint["done"] = True
+    save_checkpoint(path, checkpoint)
+    print(f"{path}: imported {checkpoint['pieces']} pieces in {time.time() - start_time:.1f}s, "
+          f"skipped {checkpoint['skipped']} records")
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Imports iTEM exports (.csv, .json or .jsonl, optionally .gz) of "
+                                                 "Seymour pieces into the database.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--item-id", choices=sorted(startup_cache.SEYMOUR_SLOTS),
+                        help="for exports without an itemId column, guessed from the file name otherwise")
+    parser.add_argument("--database", default=database.DATABASE_PATH)
+    parser.add_argument("--workers", type=int, help="parsing processes, defaults to one per core")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore checkpoints and import everything again")
+    args = parser.parse_args()
+
+    db = database.SeymourDatabase(args.database)
+    for path in args.paths:
+        ingest(path, db, item_id=args.item_id, workers=args.workers, batch_size=args.batch_size,
+               restart=args.restart)
+
+
+if __name__ == '__main__':
+    main()
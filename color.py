@@ -1,8 +1,94 @@
 import math
+import os
+import re
+import sys
+
+import numpy as np
+
+LAB_TABLE_PATH = "lab_table.f32"
+LAB_TABLE_SIZE = 1 << 24
+BAD_RGB = -1  # what parse_rgb gives for anything that isn't a 6 digit hex code
+HEX_CODE = re.compile(r"[0-9A-Fa-f]{6}")
+
+_lab_table = None
+_lab_table_checked = False
+
+
+def get_lab_table():
+    # opened lazily and read only, so every process shares the same page cache
+    global _lab_table, _lab_table_checked
+    if not _lab_table_checked:
+        _lab_table_checked = True
+        if os.path.exists(LAB_TABLE_PATH):
+            _lab_table = np.memmap(LAB_TABLE_PATH, dtype=np.float32, mode="r", shape=(LAB_TABLE_SIZE, 3))
+    return _lab_table
+
+
+def build_lab_table(path=LAB_TABLE_PATH, chunk_size=1 << 20):
+    temp_path = path + ".tmp"
+    table = np.memmap(temp_path, dtype=np.float32, mode="w+", shape=(LAB_TABLE_SIZE, 3))
+    for start in range(0, LAB_TABLE_SIZE, chunk_size):
+        table[start:start + chunk_size] = rgb_ints_to_lab(np.arange(start, start + chunk_size))
+    table.flush()
+    del table
+    os.replace(temp_path, path)
+
+
+def rgb_ints_to_lab(rgb_ints):
+    # vectorized rgb_to_xyz + xyz_to_cielab for packed 0xRRGGBB integers
+    rgb_ints = np.asarray(rgb_ints, dtype=np.int64)
+    rgb = np.stack(((rgb_ints >> 16) & 255, (rgb_ints >> 8) & 255, rgb_ints & 255), axis=-1) / 255
+    rgb = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92) * 100
+
+    xyz = rgb @ np.array([[0.4124, 0.2126, 0.0193],
+                          [0.3576, 0.7152, 0.1192],
+                          [0.1805, 0.0722, 0.9505]])
+    xyz /= np.array([95.047, 100, 108.883])
+    xyz = np.where(xyz > 0.008856, np.cbrt(xyz), (7.787 * xyz) + (16 / 116))
+
+    l_star = (116 * xyz[..., 1]) - 16
+    a_star = 500 * (xyz[..., 0] - xyz[..., 1])
+    b_star = 200 * (xyz[..., 1] - xyz[..., 2])
+    return np.stack((l_star, a_star, b_star), axis=-1)
+
+
+def rgb_ints_to_lab_batch(rgb_ints):
+    rgb_ints = np.asarray(rgb_ints, dtype=np.int64)
+    table = get_lab_table()
+    if table is not None:
+        return table[rgb_ints].astype(np.float64)
+    return rgb_ints_to_lab(rgb_ints)
+
+
+def parse_rgb(hex_code):
+    # exactly 6 hex digits, int(x, 16) on its own would also take "0x00ff00", " ff0000 " or "ff_00_00"
+    if not isinstance(hex_code, str) or not HEX_CODE.fullmatch(hex_code):
+        return BAD_RGB
+    return int(hex_code, 16)
+
+
+def hex_to_rgb(hex_code):
+    rgb_int = parse_rgb(hex_code)
+    if rgb_int == BAD_RGB:
+        raise ValueError(f"{hex_code!r} is not a 6 digit hex code")
+    return rgb_int
+
+
+def hex_to_lab_batch(hex_codes):
+    return rgb_ints_to_lab_batch(np.fromiter((hex_to_rgb(hex_code) for hex_code in hex_codes), dtype=np.int64))
+
+
+def unpack_rgb(rgb_int):
+    return (rgb_int >> 16) & 255, (rgb_int >> 8) & 255, rgb_int & 255
 
 
 def hex_to_lab(hex_code):
-    rgb = tuple(int(hex_code[i:i + 2], 16) for i in (0, 2, 4))
+    rgb_int = hex_to_rgb(hex_code)
+    table = get_lab_table()
+    if table is not None:
+        return tuple(table[rgb_int].tolist())
+
+    rgb = unpack_rgb(rgb_int)
     xyz = rgb_to_xyz(rgb)
     lab = xyz_to_cielab(xyz)
 
@@ -148,3 +234,79 @@ def compare_delta_cie(lab1: tuple, lab2: tuple):
 
     similarity = math.sqrt(pow(l1 - l2, 2) + pow(a1 - a2, 2) + pow(b1 - b2, 2))
     return similarity
+
+
+def compare_delta_e_2000_batch(lab1, lab_matrix):
+    return compare_delta_e_2000_matrix(np.reshape(lab1, (1, 3)), lab_matrix)[0]
+
+
+def compare_delta_e_2000_matrix(labs1, labs2):
+    # same maths as compare_delta_e_2000, broadcast to a (len(labs1), len(labs2)) matrix
+    labs1 = np.asarray(labs1, dtype=np.float64)
+    labs2 = np.asarray(labs2, dtype=np.float64)
+    l1, a1, b1 = labs1[:, 0, None], labs1[:, 1, None], labs1[:, 2, None]
+    l2, a2, b2 = labs2[None, :, 0], labs2[None, :, 1], labs2[None, :, 2]
+
+    c1 = np.sqrt(a1 ** 2 + b1 ** 2)
+    c2 = np.sqrt(a2 ** 2 + b2 ** 2)
+    c_bar = (c1 + c2) / 2
+
+    g = 0.5 * (1 - np.sqrt(c_bar ** 7 / (c_bar ** 7 + 6103525625)))
+
+    xa1 = (1 + g) * a1
+    xa2 = (1 + g) * a2
+    xc1 = np.sqrt(xa1 ** 2 + b1 ** 2)
+    xc2 = np.sqrt(xa2 ** 2 + b2 ** 2)
+    h1 = np.degrees(np.arctan2(b1, xa1))
+    h1 += (h1 < 0) * 360
+    h2 = np.degrees(np.arctan2(b2, xa2))
+    h2 += (h2 < 0) * 360
+
+    delta_l_dash = l2 - l1
+    delta_c_dash = xc2 - xc1
+    chroma_product = xc1 * xc2
+    has_hue = chroma_product != 0
+
+    h_diff = h2 - h1
+    delta_h = np.where(h_diff > 180, h_diff - 360, np.where(h_diff < -180, h_diff + 360, h_diff))
+    delta_h = np.where(has_hue, delta_h, 0.0)
+
+    delta_h_dash = 2 * np.sqrt(chroma_product) * np.sin(np.radians(delta_h) / 2.0)
+
+    l_bar = (l1 + l2) / 2
+    c_bar = (xc1 + xc2) / 2
+    h_sum = h1 + h2
+    h_bar = np.where(np.fabs(h1 - h2) <= 180, h_sum / 2, np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2))
+    h_bar = np.where(has_hue, h_bar, h_sum)
+
+    t = 1 \
+        - 0.17 * np.cos(np.radians(h_bar - 30)) \
+        + 0.24 * np.cos(np.radians(2 * h_bar)) \
+        + 0.32 * np.cos(np.radians(3 * h_bar + 6)) \
+        - 0.20 * np.cos(np.radians(4 * h_bar - 63))
+
+    delta_theta = 30 * np.exp(-((h_bar - 275) / 25) ** 2)
+
+    xrc = 2 * np.sqrt(c_bar ** 7 / (c_bar ** 7 + 6103525625))
+
+    xsl = 1 + 0.015 * (l_bar - 50) ** 2 / np.sqrt(20 + (l_bar - 50) ** 2)
+    xsc = 1 + 0.045 * c_bar
+    xsh = 1 + 0.015 * c_bar * t
+    xrt = -xrc * np.sin(2 * np.radians(delta_theta))
+
+    final_l = delta_l_dash / xsl
+    final_c = delta_c_dash / xsc
+    final_h = delta_h_dash / xsh
+
+    return np.sqrt(final_l ** 2 + final_c ** 2 + final_h ** 2 + xrt * final_c * final_h)
+
+
+def compare_delta_cie_batch(lab1, lab_matrix):
+    return np.sqrt(np.sum((np.asarray(lab_matrix, dtype=np.float64) - np.reshape(lab1, (1, 3))) ** 2, axis=1))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ["build_lab_table"]:
+        build_lab_table()
+    else:
+        print("usage: python color.py build_lab_table")
@@ -0,0 +1,381 @@
+import sqlite3
+import sys
+import time
+from threading import Lock, RLock
+
+import numpy as np
+
+import color
+
+DATABASE_PATH = "seymour_pieces.db"
+PIECE_COLUMNS = "item_id, item_uuid, owner, location, last_seen, hex_code"
+
+# how far (in Delta E 76 per axis) a piece can be from the query and still be within the given Delta E 2000, see
+# lab_search_reach. L*: the chroma/hue part of CIEDE2000 is never negative, so dE00 >= |dL| / S_L and S_L is at most
+# 1 + 0.015 * 2500 / sqrt(2520) = 1.747 for L* in 0-100
+LAB_SEARCH_FACTOR_L = 1.75
+LAB_SEARCH_ITERATIONS = 8
+BACKFILL_CHUNK_SIZE = 10000
+BULK_INSERT_THRESHOLD = 5000
+MIGRATION_PAUSE = 0.05  # between backfill chunks when migrating next to a running bot, so its writes get a turn
+BAD_RGB = color.BAD_RGB  # hex_code that isn't a hex, kept out of the dupe tables
+
+ROW_COLUMNS = f"{PIECE_COLUMNS}, lab_l, lab_a, lab_b, rgb"
+ON_PIECE_CONFLICT = ("ON CONFLICT(item_uuid) DO UPDATE SET owner = excluded.owner, location = excluded.location, "
+                     "last_seen = excluded.last_seen WHERE excluded.last_seen >= seymour_pieces.last_seen")
+UPSERT_PIECE = f"INSERT INTO seymour_pieces ({ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) {ON_PIECE_CONFLICT}"
+
+CREATE_LAB_INSERT_TRIGGER = ("CREATE TRIGGER IF NOT EXISTS seymour_lab_insert AFTER INSERT ON seymour_pieces "
+                             "WHEN new.lab_l IS NOT NULL BEGIN "
+                             "INSERT OR REPLACE INTO seymour_lab_index VALUES "
+                             "(new.rowid, new.lab_l, new.lab_l, new.lab_a, new.lab_a, new.lab_b, new.lab_b); END")
+
+# the dupe summary, pieces and distinct owners per colour. seymour_rgb_owners is what lets owners be counted without
+# going back to seymour_pieces, a piece leaving a colour only has to look at that colour's owners
+ADD_TO_DUPES = ("INSERT INTO seymour_rgb_owners SELECT new.rgb, new.owner, 1 WHERE new.owner IS NOT NULL "
+                "ON CONFLICT(rgb, owner) DO UPDATE SET pieces = pieces + 1; "
+                "INSERT INTO seymour_rgb_dupes VALUES "
+                "(new.rgb, 1, (SELECT COUNT(*) FROM seymour_rgb_owners WHERE rgb = new.rgb)) "
+                "ON CONFLICT(rgb) DO UPDATE SET pieces = pieces + 1, owners = excluded.owners; ")
+REMOVE_FROM_DUPES = ("UPDATE seymour_rgb_owners SET pieces = pieces - 1 WHERE rgb = old.rgb AND owner = old.owner; "
+                     "DELETE FROM seymour_rgb_owners WHERE rgb = old.rgb AND owner = old.owner AND pieces <= 0; "
+                     "UPDATE seymour_rgb_dupes SET pieces = pieces - 1, "
+                     "owners = (SELECT COUNT(*) FROM seymour_rgb_owners WHERE rgb = old.rgb) WHERE rgb = old.rgb; "
+                     "DELETE FROM seymour_rgb_dupes WHERE rgb = old.rgb AND pieces <= 0; ")
+CREATE_DUPE_TRIGGERS = {
+    "seymour_rgb_dupes_insert": ("CREATE TRIGGER IF NOT EXISTS seymour_rgb_dupes_insert AFTER INSERT ON seymour_pieces "
+                                 f"WHEN new.rgb >= 0 BEGIN {ADD_TO_DUPES}END"),
+    "seymour_rgb_dupes_delete": ("CREATE TRIGGER IF NOT EXISTS seymour_rgb_dupes_delete AFTER DELETE ON seymour_pieces "
+                                 f"WHEN old.rgb >= 0 BEGIN {REMOVE_FROM_DUPES}END"),
+    # upserts that move a piece to a new owner land here too. either side can be a row that isn't counted, so the
+    # two halves are separate triggers
+    "seymour_rgb_dupes_update_old": ("CREATE TRIGGER IF NOT EXISTS seymour_rgb_dupes_update_old AFTER UPDATE OF rgb, owner "
+                                     "ON seymour_pieces WHEN old.rgb >= 0 AND "
+                                     "(old.rgb IS NOT new.rgb OR old.owner IS NOT new.owner) "
+                                     f"BEGIN {REMOVE_FROM_DUPES}END"),
+    "seymour_rgb_dupes_update_new": ("CREATE TRIGGER IF NOT EXISTS seymour_rgb_dupes_update_new AFTER UPDATE OF rgb, owner "
+                                     "ON seymour_pieces WHEN new.rgb >= 0 AND "
+                                     "(old.rgb IS NOT new.rgb OR old.owner IS NOT new.owner) "
+                                     f"BEGIN {ADD_TO_DUPES}END"),
+}
+# the first version of the dupe summary was keyed on hex_code
+OLD_DUPE_TRIGGERS = ("seymour_dupes_insert", "seymour_dupes_delete", "seymour_dupes_update")
+
+_connections = {}
+_connections_lock = Lock()
+_migrated_paths = set()
+
+
+def shared_connection(path=DATABASE_PATH):
+    # one connection per database file for the whole process, shared by the scanner threads and the bot.
+    # anything using it holds the lock for the whole transaction
+    with _connections_lock:
+        if path not in _connections:
+            con = sqlite3.connect(path, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA cache_size=-65536")
+            _connections[path] = (con, RLock())
+        return _connections[path]
+
+
+def add_rgb_column(con):
+    # packed 0xRRGGBB, what every lookup by colour goes through instead of the hex_code text
+    columns = {x[1] for x in con.execute("PRAGMA table_info(seymour_pieces)")}
+    if "rgb" not in columns:
+        con.execute("ALTER TABLE seymour_pieces ADD COLUMN rgb INTEGER")
+    con.execute("CREATE INDEX IF NOT EXISTS seymour_pieces_rgb ON seymour_pieces (rgb)")
+
+
+def backfill_rgb(con, lock, pause=0):
+    # one short transaction per chunk, anyone else writing to the database gets in between them
+    while True:
+        with lock, con:
+            rows = con.execute("SELECT rowid, hex_code FROM seymour_pieces WHERE rgb IS NULL LIMIT ?",
+                               (BACKFILL_CHUNK_SIZE,)).fetchall()
+            if not rows:
+                return
+            con.executemany("UPDATE seymour_pieces SET rgb = ? WHERE rowid = ?",
+                            [(color.parse_rgb(x[1]), x[0]) for x in rows])
+        if pause:
+            time.sleep(pause)
+
+
+def migrate(path=DATABASE_PATH, pause=MIGRATION_PAUSE):
+    # the slow part of moving to the rgb column, safe to run while an older version of the bot is still using the
+    # database. the switch over to the rgb keyed dupe tables happens when the new version first opens it
+    con, lock = shared_connection(path)
+    with lock, con:
+        con.execute("CREATE TABLE IF NOT EXISTS seymour_pieces "
+                    "(item_id TEXT, item_uuid TEXT, owner TEXT, location TEXT, last_seen INTEGER, hex_code TEXT)")
+        add_rgb_column(con)
+    backfill_rgb(con, lock, pause)
+
+
+def lab_search_reach(lab, radius):
+    # a*b*: dC'^2 + dH'^2 is the squared distance D' in the (a', b) plane and |da|, |db| <= D'. with x, y the chroma and
+    # hue terms, x^2 + y^2 + R_T x y >= (1 - |R_T| / 2)(x^2 + y^2) and S_H <= 1 + 0.029 C' < S_C = 1 + 0.045 C', so
+    # D' <= r (1 + 0.045 C'mean) / sqrt(1 - |R_T| / 2) with |R_T| <= R_C sin(60 deg).
+    # C'mean <= (1 + G) C1 + D' / 2, and G and R_C only depend on the mean chroma, so any bound on D' bounds them too.
+    # starting from the worst case (G = 0.5, R_C = 2) and feeding each bound back in only ever tightens it
+    l_star, a_star, b_star = lab
+    chroma = (a_star ** 2 + b_star ** 2) ** 0.5
+    cross = 1 / (1 - 3 ** 0.5 / 2) ** 0.5
+    if 0.0225 * cross * radius >= 1:
+        return radius * LAB_SEARCH_FACTOR_L, float("inf")  # past this there's no bound on a*b* at all
+    reach_ab = cross * radius * (1 + 0.0675 * chroma) / (1 - 0.0225 * cross * radius)
+    for _ in range(LAB_SEARCH_ITERATIONS):
+        c_bar_min = max(chroma - reach_ab / 2, 0)
+        g_max = 0.5 * (1 - (c_bar_min ** 7 / (c_bar_min ** 7 + 6103525625)) ** 0.5)
+        c_dash_max = (1 + g_max) * chroma + reach_ab / 2
+        rt_max = 2 * (c_dash_max ** 7 / (c_dash_max ** 7 + 6103525625)) ** 0.5 * 3 ** 0.5 / 2
+        reach_ab = min(reach_ab, radius * (1 + 0.045 * c_dash_max) / (1 - rt_max / 2) ** 0.5)
+    return radius * LAB_SEARCH_FACTOR_L, reach_ab
+
+
+class SeymourDatabase:
+    def __init__(self, path=DATABASE_PATH):
+        self.con, self.lock = shared_connection(path)
+        with self.lock:
+            if path not in _migrated_paths:
+                self.create_tables()
+                _migrated_paths.add(path)
+
+    def create_tables(self):
+        with self.lock, self.con:
+            self.con.execute("CREATE TABLE IF NOT EXISTS seymour_pieces "
+                             "(item_id TEXT, item_uuid TEXT, owner TEXT, location TEXT, last_seen INTEGER, hex_code TEXT)")
+            columns = {x[1] for x in self.con.execute("PRAGMA table_info(seymour_pieces)")}
+            for column in ("lab_l", "lab_a", "lab_b"):
+                if column not in columns:
+                    self.con.execute(f"ALTER TABLE seymour_pieces ADD COLUMN {column} REAL")
+
+            # r*tree over L*a*b*, id is the rowid of the piece it points to
+            self.con.execute("CREATE VIRTUAL TABLE IF NOT EXISTS seymour_lab_index "
+                             "USING rtree(id, min_l, max_l, min_a, max_a, min_b, max_b)")
+            self.con.execute(CREATE_LAB_INSERT_TRIGGER)
+            self.con.execute("CREATE TRIGGER IF NOT EXISTS seymour_lab_update AFTER UPDATE OF lab_l, lab_a, lab_b "
+                             "ON seymour_pieces WHEN new.lab_l IS NOT NULL BEGIN "
+                             "INSERT OR REPLACE INTO seymour_lab_index VALUES "
+                             "(new.rowid, new.lab_l, new.lab_l, new.lab_a, new.lab_a, new.lab_b, new.lab_b); END")
+            self.con.execute("CREATE TRIGGER IF NOT EXISTS seymour_lab_delete AFTER DELETE ON seymour_pieces BEGIN "
+                             "DELETE FROM seymour_lab_index WHERE id = old.rowid; END")
+
+            # upserts need item_uuid to be unique, keep the most recently seen copy of anything stored twice
+            res = self.con.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'seymour_pieces_uuid'")
+            if res.fetchone() is None:
+                self.con.execute("DELETE FROM seymour_pieces WHERE rowid IN (SELECT rowid FROM (SELECT rowid, ROW_NUMBER() "
+                                 "OVER (PARTITION BY item_uuid ORDER BY last_seen DESC) AS copy FROM seymour_pieces) "
+                                 "WHERE copy > 1)")
+                self.con.execute("CREATE UNIQUE INDEX seymour_pieces_uuid ON seymour_pieces (item_uuid)")
+            self.con.execute("CREATE INDEX IF NOT EXISTS seymour_pieces_owner ON seymour_pieces (owner)")
+            add_rgb_column(self.con)
+        self.backfill_lab()
+        backfill_rgb(self.con, self.lock)
+        with self.lock, self.con:
+            # pieces that were stored with BAD_RGB used to get FFFFFF's lab
+            self.con.execute("DELETE FROM seymour_lab_index WHERE id IN "
+                             "(SELECT rowid FROM seymour_pieces WHERE rgb < 0 AND lab_l IS NOT NULL)")
+            self.con.execute("UPDATE seymour_pieces SET lab_l = NULL, lab_a = NULL, lab_b = NULL "
+                             "WHERE rgb < 0 AND lab_l IS NOT NULL")
+            self.create_dupe_tables()
+
+    def create_dupe_tables(self):
+        for name in OLD_DUPE_TRIGGERS:
+            self.con.execute(f"DROP TRIGGER IF EXISTS {name}")
+        self.con.execute("DROP TABLE IF EXISTS seymour_hex_owners")
+        self.con.execute("DROP TABLE IF EXISTS seymour_hex_dupes")
+        self.con.execute("DROP INDEX IF EXISTS seymour_pieces_hex")  # seymour_pieces_rgb does its job now
+
+        res = self.con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'seymour_rgb_dupes'")
+        created = res.fetchone() is None
+        self.con.execute("CREATE TABLE IF NOT EXISTS seymour_rgb_owners "
+                         "(rgb INTEGER NOT NULL, owner TEXT NOT NULL, pieces INTEGER NOT NULL, "
+                         "PRIMARY KEY (rgb, owner)) WITHOUT ROWID")
+        self.con.execute("CREATE INDEX IF NOT EXISTS seymour_rgb_owners_owner ON seymour_rgb_owners (owner)")
+        self.con.execute("CREATE TABLE IF NOT EXISTS seymour_rgb_dupes "
+                         "(rgb INTEGER PRIMARY KEY, pieces INTEGER NOT NULL, owners INTEGER NOT NULL)")
+        self.con.execute("CREATE INDEX IF NOT EXISTS seymour_rgb_dupes_pieces ON seymour_rgb_dupes (pieces)")
+        for create_trigger in CREATE_DUPE_TRIGGERS.values():
+            self.con.execute(create_trigger)
+        if created:
+            self.fill_dupe_tables()
+
+    def fill_dupe_tables(self):
+        self.con.execute("DELETE FROM seymour_rgb_owners")
+        self.con.execute("DELETE FROM seymour_rgb_dupes")
+        self.con.execute("INSERT INTO seymour_rgb_owners SELECT rgb, owner, COUNT(*) FROM seymour_pieces "
+                         "WHERE rgb >= 0 AND owner IS NOT NULL GROUP BY rgb, owner")
+        self.con.execute("INSERT INTO seymour_rgb_dupes SELECT rgb, COUNT(*), COUNT(DISTINCT owner) "
+                         "FROM seymour_pieces WHERE rgb >= 0 GROUP BY rgb")
+
+    def refill_dupe_tables(self, rgbs):
+        # fill_dupe_tables for just these colours, for bulk inserts that ran without the triggers
+        self.con.execute("CREATE TEMP TABLE IF NOT EXISTS seymour_touched_rgbs (rgb INTEGER PRIMARY KEY)")
+        self.con.execute("DELETE FROM seymour_touched_rgbs")
+        self.con.executemany("INSERT OR IGNORE INTO seymour_touched_rgbs VALUES (?)", ((x,) for x in rgbs if x >= 0))
+        self.con.execute("DELETE FROM seymour_rgb_owners WHERE rgb IN (SELECT rgb FROM seymour_touched_rgbs)")
+        self.con.execute("DELETE FROM seymour_rgb_dupes WHERE rgb IN (SELECT rgb FROM seymour_touched_rgbs)")
+        # one pass over the pieces, both tables are counted from it
+        self.con.execute("CREATE TEMP TABLE IF NOT EXISTS seymour_touched_counts (rgb INTEGER, owner TEXT, pieces INTEGER)")
+        self.con.execute("DELETE FROM seymour_touched_counts")
+        self.con.execute("INSERT INTO seymour_touched_counts SELECT rgb, owner, COUNT(*) FROM seymour_pieces "
+                         "WHERE rgb IN (SELECT rgb FROM seymour_touched_rgbs) GROUP BY rgb, owner")
+        self.con.execute("INSERT INTO seymour_rgb_owners SELECT rgb, owner, pieces FROM seymour_touched_counts "
+                         "WHERE owner IS NOT NULL")
+        self.con.execute("INSERT INTO seymour_rgb_dupes SELECT rgb, SUM(pieces), COUNT(owner) FROM seymour_touched_counts "
+                         "GROUP BY rgb")
+
+    def backfill_lab(self):
+        # walks up the rowids so hex codes that don't parse (e.g. 'NONE') are passed over, their lab stays NULL and
+        # they stay out of the r*tree
+        last_rowid = 0
+        while True:
+            with self.lock, self.con:
+                rows = self.con.execute("SELECT rowid, hex_code FROM seymour_pieces WHERE lab_l IS NULL AND rowid > ? "
+                                        "ORDER BY rowid LIMIT ?", (last_rowid, BACKFILL_CHUNK_SIZE)).fetchall()
+                if not rows:
+                    return
+                last_rowid = rows[-1][0]
+                rows = [(rowid, color.parse_rgb(hex_code)) for rowid, hex_code in rows]
+                rows = [x for x in rows if x[1] != BAD_RGB]
+                if not rows:
+                    continue
+                labs = color.rgb_ints_to_lab_batch([x[1] for x in rows]).tolist()
+                self.con.executemany("UPDATE seymour_pieces SET lab_l = ?, lab_a = ?, lab_b = ? WHERE rowid = ?",
+                                     [(*lab, row[0]) for row, lab in zip(rows, labs)])
+
+    def rebuild_lab_index(self):
+        # only needed if rowids were renumbered, e.g. by a manual VACUUM
+        with self.lock, self.con:
+            self.con.execute("DELETE FROM seymour_lab_index")
+            self.con.execute("INSERT INTO seymour_lab_index SELECT rowid, lab_l, lab_l, lab_a, lab_a, lab_b, lab_b "
+                             "FROM seymour_pieces WHERE lab_l IS NOT NULL")
+
+    def rebuild_dupe_tables(self):
+        # the triggers keep these right on their own, this is for databases edited with the triggers missing
+        with self.lock, self.con:
+            self.fill_dupe_tables()
+
+    def matching_hexes(self, hex_code, item_uuid):
+        return self.fetchall(f"SELECT {PIECE_COLUMNS} FROM seymour_pieces WHERE rgb = ? and item_uuid != ?",
+                             (color.parse_rgb(hex_code), item_uuid))
+
+    def pieces_with_hexes(self, hex_codes):
+        rgbs = tuple({color.parse_rgb(x) for x in hex_codes} - {BAD_RGB})
+        return self.fetchall(f"SELECT {PIECE_COLUMNS} FROM seymour_pieces WHERE rgb IN ({','.join(['?'] * len(rgbs))})",
+                             rgbs)
+
+    def owner_dupes(self, owner):
+        # every piece sharing a colour with one of owner's pieces, where the colour has more than one owner
+        return self.fetchall(f"SELECT {PIECE_COLUMNS} FROM seymour_pieces WHERE rgb IN "
+                             "(SELECT o.rgb FROM seymour_rgb_owners o JOIN seymour_rgb_dupes d "
+                             "ON d.rgb = o.rgb WHERE o.owner = ? AND d.owners > 1) ORDER BY rgb", (owner,))
+
+    def dupe_report(self, min_pieces=3):
+        return self.fetchall(f"SELECT {PIECE_COLUMNS} FROM seymour_pieces WHERE rgb IN "
+                             "(SELECT rgb FROM seymour_rgb_dupes WHERE pieces >= ?)", (min_pieces,))
+
+    def pieces_near_lab(self, lab, radius, new_method=True):
+        # returns (item_uuid, similarity) for every piece within radius, closest first
+        l_star, a_star, b_star = lab
+        if new_method:
+            reach_l, reach_ab = lab_search_reach(lab, radius)
+        else:
+            reach_l, reach_ab = radius, radius
+        # the index stores float32 boxes rounded outwards, so take every box that touches the search box and score the
+        # exact lab stored on the piece
+        with self.lock, self.con:
+            res = self.con.execute(
+                "SELECT p.item_uuid, p.lab_l, p.lab_a, p.lab_b FROM seymour_lab_index i "
+                "JOIN seymour_pieces p ON p.rowid = i.id "
+                "WHERE i.max_l >= ? AND i.min_l <= ? AND i.max_a >= ? AND i.min_a <= ? AND i.max_b >= ? AND i.min_b <= ?",
+                (l_star - reach_l, l_star + reach_l, a_star - reach_ab, a_star + reach_ab,
+                 b_star - reach_ab, b_star + reach_ab))
+            candidates = res.fetchall()
+        if not candidates:
+            return []
+
+        candidate_labs = np.array([x[1:] for x in candidates], dtype=np.float64)
+        if new_method:
+            similarities = color.compare_delta_e_2000_batch(lab, candidate_labs)
+        else:
+            similarities = color.compare_delta_cie_batch(lab, candidate_labs)
+        return sorted(((x[0], sim) for x, sim in zip(candidates, similarities.tolist()) if sim <= radius),
+                      key=lambda x: x[1])
+
+    def fetchall(self, query, params=()):
+        with self.lock, self.con:
+            return self.con.execute(query, params).fetchall()
+
+    def fetchall_read_only(self, query, params=()):
+        # for hand written queries, anything that would write fails instead
+        with self.lock:
+            self.con.execute("PRAGMA query_only = ON")
+            try:
+                return self.con.execute(query, params).fetchall()
+            finally:
+                # a write that was refused still left sqlite3's implicit BEGIN open
+                if self.con.in_transaction:
+                    self.con.rollback()
+                self.con.execute("PRAGMA query_only = OFF")
+
+    def add_item_to_db(self, piece):
+        self.add_items_to_db([piece])
+
+    def add_items_to_db(self, pieces: list):
+        # new pieces are inserted, known ones only move owner/location if this sighting isn't older than the stored one
+        if not len(pieces):
+            return
+        rgbs = [color.parse_rgb(x.piece.hex_code) for x in pieces]
+        # BAD_RGB would index the lab table as FFFFFF, those pieces get no lab and stay out of the r*tree
+        labs = color.rgb_ints_to_lab_batch([max(x, 0) for x in rgbs]).tolist()
+        labs = [lab if rgb != BAD_RGB else (None, None, None) for lab, rgb in zip(labs, rgbs)]
+        rows = [(piece.piece.item_id, piece.piece.item_uuid, piece.owner, piece.location, piece.last_seen,
+                 piece.piece.hex_code, *lab, rgb) for piece, lab, rgb in zip(pieces, labs, rgbs)]
+        if len(rows) >= BULK_INSERT_THRESHOLD:
+            self.bulk_upsert(rows)
+            return
+        with self.lock, self.con:
+            self.con.executemany(UPSERT_PIECE, rows)
+
+    def bulk_upsert(self, rows):
+        # rows in ROW_COLUMNS order. they go into a staging table and then into seymour_pieces in one statement, with
+        # the same last_seen rule as UPSERT_PIECE (staging rows are applied in order, so a uuid staged twice ends up
+        # like two upserts would). the r*tree and dupe triggers are most of the cost of a big insert, so they're
+        # dropped and the new rows' entries filled in one go after
+        with self.lock, self.con:
+            self.con.execute("BEGIN")  # explicit so dropping the triggers is part of the transaction
+            self.con.execute(f"CREATE TEMP TABLE IF NOT EXISTS seymour_staging ({ROW_COLUMNS})")
+            self.con.execute("DELETE FROM seymour_staging")
+            self.con.executemany(f"INSERT INTO seymour_staging VALUES ({', '.join(['?'] * 10)})", rows)
+            last_rowid = self.con.execute("SELECT IFNULL(MAX(rowid), 0) FROM seymour_pieces").fetchone()[0]
+            # the colours being added to, and the ones pieces that change colour are leaving
+            touched_rgbs = [x[0] for x in self.con.execute(
+                "SELECT rgb FROM seymour_staging UNION "
+                "SELECT p.rgb FROM seymour_pieces p JOIN seymour_staging s ON s.item_uuid = p.item_uuid")]
+            self.con.execute("DROP TRIGGER seymour_lab_insert")
+            for name in CREATE_DUPE_TRIGGERS:
+                self.con.execute(f"DROP TRIGGER {name}")
+            self.con.execute(f"INSERT INTO seymour_pieces ({ROW_COLUMNS}) SELECT {ROW_COLUMNS} FROM seymour_staging "
+                             f"WHERE true ORDER BY rowid {ON_PIECE_CONFLICT}")
+            self.con.execute("INSERT INTO seymour_lab_index SELECT rowid, lab_l, lab_l, lab_a, lab_a, lab_b, lab_b "
+                             "FROM seymour_pieces WHERE rowid > ? AND lab_l IS NOT NULL", (last_rowid,))
+            self.refill_dupe_tables(touched_rgbs)
+            self.con.execute(CREATE_LAB_INSERT_TRIGGER)
+            for create_trigger in CREATE_DUPE_TRIGGERS.values():
+                self.con.execute(create_trigger)
+            self.con.execute("DELETE FROM seymour_staging")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["migrate"]:
+        migrate()
+        if "--vacuum" in sys.argv:
+            # rewrites the whole file, so only with the bot stopped. VACUUM can renumber rowids, the r*tree follows them
+            db = SeymourDatabase()
+            with db.lock:
+                db.con.execute("VACUUM")
+            db.rebuild_lab_index()
+    else:
+        print("usage: python database.py migrate [--vacuum]")
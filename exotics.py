@@ -1,4 +1,4 @@
-import json
+import startup_cache
 
 crystal_hexes = ["1F0030", "46085E", "54146E", "5D1C78", "63237D", "6A2C82", "7E4196", "8E51A6", "9C64B3", "A875BD",
                  "B88BC9", "C6A3D4", "D9C1E3", "E5D1ED", "EFE1F5", "FCF3FF"]
@@ -14,8 +14,7 @@ og_fairy_ids = {
         "FF66B2": [298]
 }
 
-with open('default_hexes.json', "r") as r:
-    default_hexes = json.load(r)
+default_hexes = startup_cache.shared().default_hexes
 
 
 def get_exotic_type(nbt_data):
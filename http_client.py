@@ -0,0 +1,156 @@
+import asyncio
+import json
+import random
+import time
+import traceback
+from threading import Thread
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+MAX_BACKOFF = 8
+
+
+class EndpointClass:
+    def __init__(self, name, timeout, attempts, limit_per_host, backoff=0.5):
+        self.name = name
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.attempts = attempts
+        self.limit_per_host = limit_per_host
+        self.backoff = backoff
+
+
+HYPIXEL = EndpointClass("hypixel", timeout=10, attempts=4, limit_per_host=64)
+MOJANG = EndpointClass("mojang", timeout=5, attempts=3, limit_per_host=8)
+I_TEM = EndpointClass("iTEM", timeout=20, attempts=3, limit_per_host=4, backoff=1)
+# museum alerts would rather skip a refresh than wait a minute on retries
+I_TEM_POSITIONS = EndpointClass("iTEM positions", timeout=6, attempts=2, limit_per_host=4, backoff=1)
+GITHUB = EndpointClass("github", timeout=60, attempts=1, limit_per_host=4)
+DEFAULT = EndpointClass("default", timeout=10, attempts=3, limit_per_host=8)
+
+ENDPOINT_CLASSES = {
+    "api.hypixel.net": HYPIXEL,
+    "api.mojang.com": MOJANG,
+    "sessionserver.mojang.com": MOJANG,
+    "api.ashcon.app": MOJANG,
+    "api.tem.cx": I_TEM,
+    "raw.githubusercontent.com": GITHUB,
+}
+
+
+class HttpClient:
+    # one aiohttp session on its own event loop thread, shared by the scanner threads and the bot.
+    # sync code calls get_json / post_json, coroutines on any other loop await fetch_json / submit
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.host_limits = {}
+        Thread(target=self.loop.run_forever, name="http-client", daemon=True).start()
+
+    @staticmethod
+    def endpoint_class(host):
+        return ENDPOINT_CLASSES.get(host, DEFAULT)
+
+    def host_limit(self, host):
+        # only ever touched from the client loop, so no lock needed
+        limit = self.host_limits.get(host)
+        if limit is None:
+            limit = self.host_limits[host] = asyncio.Semaphore(self.endpoint_class(host).limit_per_host)
+        return limit
+
+    def ensure_session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0, ttl_dns_cache=300))
+
+    async def request_json(self, method, url, data=None, endpoint=None):
+        self.ensure_session()
+        host = urlsplit(url).hostname
+        endpoint = endpoint or self.endpoint_class(host)
+        for attempt in range(endpoint.attempts):
+            last_attempt = attempt == endpoint.attempts - 1
+            delay = self.backoff(endpoint, attempt)
+            outcome = "error"
+            try:
+                async with self.host_limit(host):
+                    start = time.perf_counter()  # after the semaphore, so this is the endpoint's time and not ours
+                    async with self.session.request(method, url, data=data, timeout=endpoint.timeout) as resp:
+                        outcome = str(resp.status)
+                        if resp.status not in RETRY_STATUSES or last_attempt:
+                            result = await resp.json(content_type=None)
+                            metrics.observe("http_request_seconds", time.perf_counter() - start, host=host)
+                            return result
+                        retry_after = resp.headers.get("Retry-After")
+                        if retry_after and retry_after.isdigit():
+                            delay = float(retry_after)
+            except aiohttp.ClientConnectionError as e:
+                outcome = "connection_error"
+                print(f"Connection Error! {str(e)}"
+                      "\nThis is most likely Hypixel's fault, just wait it out.")
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                print(f"Request to {endpoint.name} timed out.")
+            except json.JSONDecodeError as e:
+                print("thomas' fault.")
+                print(e)
+                return None
+            except Exception as e:
+                print("Unexpected Error!"
+                      f"\n{str(e)}")
+                traceback.print_tb(e.__traceback__)
+            finally:
+                metrics.inc("http_requests_total", host=host, outcome=outcome)
+            if not last_attempt:
+                await asyncio.sleep(delay)
+        metrics.inc("http_gave_up_total", host=host)
+        print(f"Gave up on {url} after {endpoint.attempts} attempts.")
+        return None
+
+    async def request_revalidated(self, url, etag=None, last_modified=None):
+        # conditional get for things we keep a copy of. returns (status, json or None on a 304, etag, last modified),
+        # or None if it didn't work out and the copy should just be kept
+        self.ensure_session()
+        host = urlsplit(url).hostname
+        endpoint = self.endpoint_class(host)
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        try:
+            async with self.host_limit(host):
+                async with self.session.get(url, headers=headers, timeout=endpoint.timeout) as resp:
+                    metrics.inc("http_requests_total", host=host, outcome=str(resp.status))
+                    if resp.status == 304:
+                        return 304, None, etag, last_modified
+                    if resp.status != 200:
+                        print(f"Couldn't revalidate {url}, got a {resp.status}.")
+                        return None
+                    return (200, await resp.json(content_type=None), resp.headers.get("ETag"),
+                            resp.headers.get("Last-Modified"))
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+            print(f"Couldn't revalidate {url}: {str(e)}")
+            return None
+
+    @staticmethod
+    def backoff(endpoint, attempt):
+        # full jitter, so a burst of failed page downloads doesn't retry in lockstep
+        return random.uniform(0, min(endpoint.backoff * 2 ** attempt, MAX_BACKOFF))
+
+    def submit(self, coro):
+        # returns a concurrent.futures.Future, usable with as_completed
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def get_json(self, url):
+        return self.submit(self.request_json("GET", url)).result()
+
+    def get_json_revalidated(self, url, etag=None, last_modified=None):
+        return self.submit(self.request_revalidated(url, etag, last_modified)).result()
+
+    def post_json(self, url, data):
+        return self.submit(self.request_json("POST", url, data)).result()
+
+    async def fetch_json(self, url):
+        return await asyncio.wrap_future(self.submit(self.request_json("GET", url)))
@@ -1,45 +1,58 @@
+import asyncio
+import copy
 import json
-import sqlite3
+import multiprocessing
 import time
 import traceback
-from base64 import b64decode
 from collections import defaultdict
-from datetime import datetime, timedelta
-from pytz import timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache
 from io import BytesIO
 from threading import Thread
 
 import disnake
-import python_nbt.nbt as nbt
-import requests
+import numpy as np
 from PIL import Image
-from discord_webhook import DiscordWebhook, DiscordEmbed
+from discord_webhook import DiscordEmbed
 from disnake.ext import commands
-from requests.adapters import HTTPAdapter
-from requests.exceptions import JSONDecodeError
-from urllib3.util.retry import Retry
 
+import auction_classifier
 import color
 import config
+import database
 import exotics
-
-session = requests.Session()
-retry = Retry(connect=3, backoff_factor=0.5)
-adapter = HTTPAdapter(max_retries=retry)
-session.mount('http://', adapter)
-session.mount('https://', adapter)
+import http_client
+import metrics
+import museum_store
+import name_cache
+import nbt_reader
+import nearest_table
+import position_lookup
+import seen_auctions
+import startup_cache
+import timestamps
+import webhooks
+
+NAME_LOOKUP_WORKERS = 8
+INVENTORY_DECODE_WORKERS = 8
+DUPE_RESOLUTION_WORKERS = 4
+INVENTORY_MENUS = ["inv_contents", "inv_armor", "wardrobe_contents", "ender_chest_contents", "backpack_contents",
+                   "personal_vault_contents"]
+SEYMOUR_ID_BYTES = tuple(x.encode() for x in auction_classifier.SEYMOUR_ITEM_IDS)
+# dungeon items whose starred versions are tracked as their own item on iTEM
+STARRED_POSITION_ITEMS = frozenset(("STONE_BLADE", "ADAPTIVE_BOOTS", "ADAPTIVE_CHESTPLATE", "ADAPTIVE_HELMET", "ADAPTIVE_LEGGINGS", "BONZO_MASK", "BONZO_STAFF", "LAST_BREATH", "SHADOW_ASSASSIN_BOOTS", "SHADOW_ASSASSIN_CHESTPLATE", "SHADOW_ASSASSIN_HELMET", "SHADOW_ASSASSIN_LEGGINGS", "SHADOW_FURY", "SPIDER_QUEENS_STINGER", "VENOMS_TOUCH", "SPIRIT_MASK", "THORNS_BOOTS", "BAT_WAND", "ITEM_SPIRIT_BOW", "BONE_BOOMERANG", "FELTHORN_REAPER"))
+
+http = http_client.HttpClient()
+i_tem_positions = position_lookup.PositionLookup(http)
 
 bot = commands.InteractionBot()
 
-with open('default_hexes.json', "r") as r:
-    default_hexes = json.load(r)
-
-with open('museum_info.json', "r") as r:
-    oldest_items = json.load(r)
+startup = startup_cache.shared()
+default_hexes = startup.default_hexes
+item_images = startup.item_images  # filled from the snapshot, revalidated in the background once main() runs
 
-RARE_UNOBTAINABLE_ITEMS = ['REINFORCED_IRON_ARROW', 'GOLD_TIPPED_ARROW', 'REDSTONE_TIPPED_ARROW', 'EMERALD_TIPPED_ARROW', 'BOUNCY_ARROW', 'ICY_ARROW', 'ARMORSHRED_ARROW', 'EXPLOSIVE_ARROW', 'GLUE_ARROW', 'NANSORB_ARROW']
-OG_REFORGE_LIST = ["godly", "unpleasant", "keen", "superior", "forceful", "hurtful", "demonic", "strong", "zealous"]
-DUNGEON_ITEM_LIST = ["ROTTEN_HELMET", "ROTTEN_CHESTPLATE", "ROTTEN_LEGGINGS", "ROTTEN_BOOTS", "ZOMBIE_SOLDIER_HELMET", "ZOMBIE_SOLDIER_CHESTPLATE", "ZOMBIE_SOLDIER_LEGGINGS", "ZOMBIE_SOLDIER_BOOTS", "ZOMBIE_KNIGHT_HELMET", "ZOMBIE_KNIGHT_CHESTPLATE", "ZOMBIE_KNIGHT_LEGGINGS", "ZOMBIE_KNIGHT_BOOTS", "ZOMBIE_COMMANDER_HELMET", "ZOMBIE_COMMANDER_CHESTPLATE", "ZOMBIE_COMMANDER_LEGGINGS", "ZOMBIE_COMMANDER_BOOTS", "ZOMBIE_LORD_HELMET", "ZOMBIE_LORD_CHESTPLATE", "ZOMBIE_LORD_LEGGINGS", "ZOMBIE_LORD_BOOTS", "HEAVY_HELMET", "HEAVY_CHESTPLATE", "HEAVY_LEGGINGS", "HEAVY_BOOTS", "SUPER_HEAVY_HELMET", "SUPER_HEAVY_CHESTPLATE", "SUPER_HEAVY_LEGGINGS", "SUPER_HEAVY_BOOTS", "SKELETON_GRUNT_HELMET", "SKELETON_GRUNT_CHESTPLATE", "SKELETON_GRUNT_LEGGINGS", "SKELETON_GRUNT_BOOTS", "SKELETON_SOLDIER_HELMET", "SKELETON_SOLDIER_CHESTPLATE", "SKELETON_SOLDIER_LEGGINGS", "SKELETON_SOLDIER_BOOTS", "SKELETON_MASTER_HELMET", "SKELETON_MASTER_CHESTPLATE", "SKELETON_MASTER_LEGGINGS", "SKELETON_MASTER_BOOTS", "SKELETON_LORD_HELMET", "SKELETON_LORD_CHESTPLATE", "SKELETON_LORD_LEGGINGS", "SKELETON_LORD_BOOTS", "BOUNCY_HELMET", "BOUNCY_CHESTPLATE", "BOUNCY_LEGGINGS", "BOUNCY_BOOTS", "SKELETOR_HELMET", "SKELETOR_CHESTPLATE", "SKELETOR_LEGGINGS", "SKELETOR_BOOTS", "SNIPER_HELMET", "ZOMBIE_SOLDIER_CUTLASS", "ZOMBIE_KNIGHT_SWORD", "ZOMBIE_COMMANDER_WHIP", "CRYPT_DREADLORD_SWORD", "CRYPT_BOW", "MACHINE_GUN_BOW", "SNIPER_BOW", "CONJURING_SWORD", "EARTH_SHARD", "SILENT_DEATH", "ICE_SPRAY_WAND"]
+museum_records = museum_store.MuseumStore()
 
 
 class AuctionThread(Thread):
@@ -49,71 +62,61 @@ class AuctionThread(Thread):
 
 
 def get_json(url):
-    while True:
-        try:
-            resp = session.get(url, timeout=10)
-            json_resp = resp.json()
-            return json_resp
-        except requests.exceptions.ConnectionError as e:
-            print(f"Connection Error! {str(e)}"
-                  "\nThis is most likely Hypixel's fault, just wait it out.")
-        except requests.exceptions.Timeout:
-            print("Request timed out.")
-        except JSONDecodeError as e:
-            print("thomas' fault.")
-            print(e)
-            return None
-        except Exception as e:
-            print("Unexpected Error!"
-                  f"\n{str(e)}")
-            traceback.print_tb(e.__traceback__)
+    return http.get_json(url)
 
 
-temp_item_hashes = get_json("https://raw.githubusercontent.com/Altpapier/Skyblock-Item-Emojis/main/v3/itemHash.json")
-temp_hash_images = get_json("https://raw.githubusercontent.com/Altpapier/Skyblock-Item-Emojis/main/v3/images.json")
-item_images = {}
-for temp_item_id, temp_item_hash in temp_item_hashes.items():
-    if temp_item_hash not in temp_hash_images:
-        continue
-    item_images[temp_item_id] = temp_hash_images[temp_item_hash]['normal']
+webhook_dispatcher = webhooks.WebhookDispatcher({
+    "seymour": config.seymour_webhook_url,
+    "museum": config.museum_webhook_url,
+    "exotic": config.exotic_webhook_url,
+    "bs": config.bs_webhook_url
+})
 
 
-def send_to_webhook(webhook_name="bs", content=None, embed=None, file_path=None):
-    if webhook_name == "seymour":
-        webhook = DiscordWebhook(config.seymour_webhook_url)
-    elif webhook_name == "museum":
-        webhook = DiscordWebhook(config.museum_webhook_url)
-    elif webhook_name == "exotic":
-        webhook = DiscordWebhook(config.exotic_webhook_url)
-    else:
-        webhook = DiscordWebhook(config.bs_webhook_url)
+def send_to_webhook(webhook_name="bs", content=None, embed=None, file_bytes=None, file_name="armor_image.png",
+                    batchable=True):
+    # only queues the message, the dispatcher threads batch and send it
+    if webhook_name not in webhook_dispatcher.queues:
+        webhook_name = "bs"
+    return webhook_dispatcher.enqueue(webhook_name, content, embed, file_bytes, file_name, batchable)
+
 
-    if content:
-        webhook.set_content(content)
-    if embed:
-        webhook.add_embed(embed)
-    if file_path:
-        with open(file_path, "rb") as attachment:
-            webhook.add_file(attachment.read(), "armor_image.png")
-    webhook.execute(remove_embeds=True)
-    webhook.set_content("")
+metrics.register_gauge("webhook_queue_depth", webhook_dispatcher.queue_sizes, label="webhook")
+metrics.register_gauge("museum_records_dirty", lambda: len(museum_records.dirty))
+metrics.register_gauge("timestamp_cache", lambda: timestamps.date_to_museum_unix.cache_info()._asdict(), label="stat")
+
+
+player_names = name_cache.PlayerNameCache(database.DATABASE_PATH)
 
 
 def get_name_and_uuid(input_name=None, input_uuid=None):
+    if not input_name and not input_uuid:
+        print("nice one idiot")
+        return "Unknown", "Unknown"
+
+    cached = player_names.get(input_name=input_name, input_uuid=input_uuid)
+    if cached is not None:
+        return cached
+
+    with metrics.timer("stage_seconds", stage="name_lookup"):
+        name, uuid = fetch_name_and_uuid(input_name=input_name, input_uuid=input_uuid)
+    if uuid != "Unknown":
+        player_names.put(name, uuid)
+    return name, uuid
+
+
+def fetch_name_and_uuid(input_name=None, input_uuid=None):
     if input_name:
         url_to_call = f"https://api.mojang.com/users/profiles/minecraft/{input_name}"
-    elif input_uuid:
-        url_to_call = f"https://api.mojang.com/user/profile/{input_uuid}"
     else:
-        print("nice one idiot")
-        return "Unknown", "Unknown"
+        url_to_call = f"https://api.mojang.com/user/profile/{input_uuid}"
 
     try:
         player_info = get_json(url_to_call)
         name = player_info['name']
         uuid = player_info['id']
         return name, uuid
-    except KeyError:  # for when mojang breaks
+    except (KeyError, TypeError):  # for when mojang breaks
         pass
 
     try:
@@ -121,10 +124,18 @@ def get_name_and_uuid(input_name=None, input_uuid=None):
         name = player_info['username']
         uuid = player_info['uuid'].replace("-", "")
         return name, uuid
-    except KeyError:  # for when it breaks
+    except (KeyError, TypeError):  # for when it breaks
         return "Unknown", "Unknown"
 
 
+def get_names_for_uuids(uuids) -> dict[str, str]:
+    # resolves every distinct uuid at once, only the ones missing from the cache hit the network
+    uuids = list(dict.fromkeys(uuids))
+    with ThreadPoolExecutor(max_workers=NAME_LOOKUP_WORKERS) as executor:
+        results = executor.map(lambda uuid: get_name_and_uuid(input_uuid=uuid)[0], uuids)
+        return dict(zip(uuids, results))
+
+
 class SeymourPiece:
     def __init__(self, item_id: str, item_uuid: str, hex_code: str):
         self.item_id = item_id
@@ -132,165 +143,161 @@ class SeymourPiece:
         self.hex_code = hex_code
 
 
-def find_closest_skyblock_piece(piece: SeymourPiece, length: int = 1, new_method: bool = True):
-    lab1 = color.hex_to_lab(piece.hex_code)
-    closest_list = defaultdict(list)
-    for skyblock_item, color_data in {**default_hexes[piece.item_id], **default_hexes["OTHER"]}.items():
-        if new_method:
-            similarity = color.compare_delta_e_2000(lab1, color_data['lab'])
-        else:
-            similarity = color.compare_delta_cie(lab1, color_data['lab'])
-        closest_list[similarity].append(color_data['name'])
+class ReferencePalette:
+    def __init__(self, names: list[str], labs):
+        self.names = names
+        self.labs = labs
+        self.lab_tuples = [tuple(x) for x in labs.tolist()]
+
+
+reference_palettes = {item_id: ReferencePalette(*palette) for item_id, palette in startup.palettes.items()}
+
 
-    closest_list = [(y, x) for x, y in closest_list.items()]
-    closest_list = sorted(closest_list, key=lambda x: x[1])
+def rank_similarities(names: list[str], similarities, length: int):
+    # equal similarities are grouped into one entry, and only the closest crystal / fairy piece is kept
+    similarities = similarities.tolist()
+    closest_list = []
     crystal_found, fairy_found = False, False
-    for data in closest_list:
-        pieces, sim = data
-        to_remove = []
-        for piece in pieces:
-            if piece.startswith("Crystal "):
-                if crystal_found:
-                    to_remove.append(piece)
-                crystal_found = True
-            elif piece.startswith("Fairy "):
-                if fairy_found:
-                    to_remove.append(piece)
-                fairy_found = True
-        for piece in to_remove:
-            pieces.remove(piece)
-    closest_list = [(', '.join(data[0]), data[1]) for data in closest_list if len(data[0]) > 0]
+    group, group_sim = [], None
+    for index in sorted(range(len(similarities)), key=similarities.__getitem__):
+        sim = similarities[index]
+        if sim != group_sim:
+            if group:
+                closest_list.append((', '.join(group), group_sim))
+                if len(closest_list) >= length:
+                    return closest_list
+            group, group_sim = [], sim
+        name = names[index]
+        if name.startswith("Crystal "):
+            if crystal_found:
+                continue
+            crystal_found = True
+        elif name.startswith("Fairy "):
+            if fairy_found:
+                continue
+            fairy_found = True
+        group.append(name)
+    if group:
+        closest_list.append((', '.join(group), group_sim))
     return closest_list[0:length]
 
 
-def create_armor_image(piece: SeymourPiece):
-    armor_path = f"a/{piece.item_id.lower()}.png"
-    armor_overlay_path = f"a/{piece.item_id.lower()}_overlay.png"
-    overlay_color = tuple(int(piece.hex_code[i:i + 2], 16) for i in (0, 2, 4))
+def rank_from_nearest_table(piece: SeymourPiece, lab1, length: int):
+    # the precomputed table only knows which references make the top 3, their delta e is worked out again here
+    if length > nearest_table.TOP_GROUPS:
+        return None
+    indexes = nearest_table.lookup(piece.item_id, piece.hex_code, startup.hexes_digest)
+    if indexes is None:
+        return None
+    palette = reference_palettes[piece.item_id]
+    similarities = np.array([color.compare_delta_e_2000(lab1, palette.lab_tuples[i]) for i in indexes])
+    return rank_similarities([palette.names[i] for i in indexes], similarities, length)
+
+
+@metrics.timed("stage_seconds", stage="closest_piece")
+def find_closest_skyblock_piece(piece: SeymourPiece, length: int = 1, new_method: bool = True):
+    lab1 = color.hex_to_lab(piece.hex_code)
+    palette = reference_palettes[piece.item_id]
+    if new_method:
+        closest_list = rank_from_nearest_table(piece, lab1, length)
+        if closest_list is not None:
+            return closest_list
+        similarities = color.compare_delta_e_2000_batch(lab1, palette.labs)
+    else:
+        similarities = color.compare_delta_cie_batch(lab1, palette.labs)
+    return rank_similarities(palette.names, similarities, length)
+
+
+def find_closest_skyblock_pieces(pieces: list[SeymourPiece], length: int = 1):
+    # batched version of find_closest_skyblock_piece, one matrix per armor slot
+    results = [None] * len(pieces)
+    by_slot = defaultdict(list)
+    for index, piece in enumerate(pieces):
+        by_slot[piece.item_id].append(index)
+
+    use_table = nearest_table.get_table(startup.hexes_digest) is not None
+    for item_id, indexes in by_slot.items():
+        if use_table:
+            for index in indexes:
+                piece = pieces[index]
+                results[index] = rank_from_nearest_table(piece, color.hex_to_lab(piece.hex_code), length)
+            indexes = [x for x in indexes if results[x] is None]
+            if not indexes:
+                continue
+        palette = reference_palettes[item_id]
+        labs = color.hex_to_lab_batch([pieces[i].hex_code for i in indexes])
+        similarity_matrix = color.compare_delta_e_2000_matrix(labs, palette.labs)
+        for row, index in enumerate(indexes):
+            results[index] = rank_similarities(palette.names, similarity_matrix[row], length)
+    return results
 
-    grayscale_image = Image.open(armor_path)
-    light_array = grayscale_image.convert('L')
-    rgba_array = grayscale_image.convert('RGBA')
 
-    result_image = Image.new('RGBA', rgba_array.size)
-    for x in range(light_array.width):
-        for y in range(light_array.height):
-            light_value = light_array.getpixel((x, y))
-            adjusted_color = tuple(int(c * (light_value / 255)) for c in overlay_color)
-            alpha = rgba_array.getpixel((x, y))[-1]
-            rgba = adjusted_color + (alpha,)
-            result_image.putpixel((x, y), rgba)
+armor_sprites = {}
 
-    overlay_image = Image.open(armor_overlay_path)
-    result_image.paste(overlay_image, (0, 0), mask=overlay_image)
-    result_image = result_image.resize((128, 128), resample=Image.BOX)
-    return result_image
 
+def get_armor_sprite(item_id: str):
+    # (light 0-1, alpha, overlay image), read from disk once per armor type
+    sprite = armor_sprites.get(item_id)
+    if sprite is None:
+        grayscale_image = Image.open(f"a/{item_id.lower()}.png")
+        light_array = np.asarray(grayscale_image.convert('L'), dtype=np.float64) / 255
+        alpha_array = np.asarray(grayscale_image.convert('RGBA'))[..., 3]
+        overlay_image = Image.open(f"a/{item_id.lower()}_overlay.png")
+        overlay_image.load()
+        sprite = armor_sprites[item_id] = (light_array, alpha_array, overlay_image)
+    return sprite
 
-class SeymourPieceWithOwnership:
-    def __init__(self, piece: SeymourPiece, owner_uuid: str, location: str, last_seen: int):
-        self.piece = piece
-        self.owner = owner_uuid
-        self.location = location
-        self.last_seen = last_seen
 
+@lru_cache(maxsize=1024)
+def render_armor_image(item_id: str, hex_code: str) -> bytes:
+    light_array, alpha_array, overlay_image = get_armor_sprite(item_id)
+    overlay_color = np.array(color.unpack_rgb(int(hex_code, 16)), dtype=np.float64)
 
-class SeymourDatabase:
-    def __init__(self):
-        self.con = sqlite3.connect("seymour_pieces.db")
-
-    def item_exists(self, item_uuid):
-        with self.con:
-            res = self.con.execute('SELECT item_uuid FROM seymour_pieces WHERE item_uuid = ?', (item_uuid,))
-            return res.fetchone() is not None
-
-    def existing_items(self, item_uuids: list[str]) -> set[str]:
-        with self.con:
-            res = self.con.execute(
-                f'SELECT item_uuid FROM seymour_pieces WHERE item_uuid IN ({",".join(["?"] * len(item_uuids))})',
-                tuple(item_uuids))
-            return set(x[0] for x in res.fetchall())
-
-    def matching_hexes(self, hex_code, item_uuid):
-        with self.con:
-            res = self.con.execute(
-                "SELECT * FROM seymour_pieces WHERE hex_code = ? and item_uuid != ?",
-                (hex_code, item_uuid))
-        return res.fetchall()
-
-    def insert_item(self, piece: SeymourPieceWithOwnership):
-        with self.con:
-            self.con.execute("INSERT INTO seymour_pieces VALUES (?, ?, ?, ?, ?, ?)",
-                             (piece.piece.item_id, piece.piece.item_uuid, piece.owner,
-                              piece.location, piece.last_seen, piece.piece.hex_code))
-
-    def insert_items(self, pieces: dict[str, SeymourPieceWithOwnership]):
-        with self.con:
-            for piece in pieces.values():
-                self.con.execute("INSERT INTO seymour_pieces VALUES (?, ?, ?, ?, ?, ?)",
-                                 (piece.piece.item_id, piece.piece.item_uuid, piece.owner,
-                                  piece.location, piece.last_seen, piece.piece.hex_code))
-
-    def update_item(self, piece: SeymourPieceWithOwnership):
-        with self.con:
-            res = self.con.execute('SELECT last_seen FROM seymour_pieces WHERE item_uuid = ?', (piece.piece.item_uuid,))
-            current_last_seen = res.fetchone()
-            if current_last_seen is None:  # not me checking this one twice
-                return
-            if piece.last_seen < current_last_seen[0]:
-                return
+    rgba = np.empty(light_array.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = overlay_color * light_array[..., None]
+    rgba[..., 3] = alpha_array
+    result_image = Image.fromarray(rgba, 'RGBA')
 
-            self.con.execute(
-                "UPDATE seymour_pieces SET owner = ?, location = ?, last_seen = ? WHERE item_uuid = ?",
-                (piece.owner, piece.location, piece.last_seen, piece.piece.item_uuid)
-            )
-
-    def update_items(self, pieces: dict[str, SeymourPieceWithOwnership]):
-        with self.con:
-            res = self.con.execute(
-                f'SELECT item_uuid,last_seen FROM seymour_pieces WHERE item_uuid IN ({",".join(["?"] * len(pieces))})',
-                tuple(pieces.keys()))
-            for data in res.fetchall():
-                current_last_seen = data[1]
-                piece = pieces[data[0]]
-                if piece.last_seen < current_last_seen:
-                    continue
-                self.con.execute(
-                    "UPDATE seymour_pieces SET owner = ?, location = ?, last_seen = ? WHERE item_uuid = ?",
-                    (piece.owner, piece.location, piece.last_seen, piece.piece.item_uuid)
-                )
-
-    def add_item_to_db(self, piece: SeymourPieceWithOwnership):
-        if self.item_exists(piece.piece.item_uuid):
-            self.update_item(piece)
-        else:
-            self.insert_item(piece)
+    result_image.paste(overlay_image, (0, 0), mask=overlay_image)
+    result_image = result_image.resize((128, 128), resample=Image.BOX)
+    image_bytes = BytesIO()
+    result_image.save(image_bytes, format="PNG")
+    return image_bytes.getvalue()
 
-        self.con.commit()
 
-    def add_items_to_db(self, pieces: list[SeymourPieceWithOwnership]):
-        item_uuids = {x.piece.item_uuid: x for x in pieces}
-        existing_uuids = self.existing_items(list(item_uuids.keys()))
-        existing_items = {x: item_uuids[x] for x in existing_uuids}
-        bad_items = {x: y for x, y in item_uuids.items() if x not in existing_uuids}
+@metrics.timed("stage_seconds", stage="render_image")
+def create_armor_image(piece: SeymourPiece) -> bytes:
+    return render_armor_image(piece.item_id, piece.hex_code.upper())
 
-        if len(existing_items):
-            self.update_items(existing_items)
 
-        if len(bad_items):
-            self.insert_items(bad_items)
+metrics.register_gauge("armor_image_cache", lambda: render_armor_image.cache_info()._asdict(), label="stat")
 
-        self.con.commit()
 
-    def close_connection(self):
-        self.con.close()
+class SeymourPieceWithOwnership:
+    def __init__(self, piece: SeymourPiece, owner_uuid: str, location: str, last_seen: int):
+        self.piece = piece
+        self.owner = owner_uuid
+        self.location = location
+        self.last_seen = last_seen
 
 
 class AuctionScanner:
     def __init__(self):
         self.API_URL = "https://api.hypixel.net"
-        self.db = SeymourDatabase()
+        self.db = database.SeymourDatabase()
         self.prev_update = 0
+        self.seen_auctions = seen_auctions.SeenAuctionIndex(database.DATABASE_PATH)
+        self.decode_pool = None
+        if getattr(config, "decode_processes", 0):
+            # not fork, by now other threads are running and a forked worker could start out stuck on a lock one of
+            # them held. the workers only run auction_classifier, so the fork server loads that up front
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["auction_classifier"])
+            self.decode_pool = ProcessPoolExecutor(max_workers=config.decode_processes, mp_context=context)
+        self.dupe_pool = None
+        if getattr(config, "defer_dupe_details", False):  # send seymour alerts straight away, edit the dupes in after
+            self.dupe_pool = ThreadPoolExecutor(max_workers=DUPE_RESOLUTION_WORKERS)
+        metrics.register_gauge("seen_auctions", self.seen_auctions.__len__)
 
     @staticmethod
     def human_format(num):
@@ -342,10 +349,10 @@ class AuctionScanner:
             hex_code = hex_code.replace("0x", "").upper().rjust(6, "0")
             armor_type = {298: "VELVET_TOP_HAT", 299: "CASHMERE_JACKET", 300: "SATIN_TROUSERS", 301: "OXFORD_SHOES"}[nbt_data['i'][0]['id']]
             piece_image = create_armor_image(SeymourPiece(armor_type, "", hex_code))
-            piece_image.save("a/armor_piece.png")
-            embed.set_thumbnail(url="attachment://armor_image.png")
+            image_name = f"{armor_type.lower()}_{hex_code}.png"  # unique within a batched message
+            embed.set_thumbnail(url=f"attachment://{image_name}")
             embed.add_embed_field(name="Hex", value="#" + hex_code, inline=True)
-            send_to_webhook(webhook_name=webhook_name, embed=embed, file_path="a/armor_piece.png")
+            send_to_webhook(webhook_name=webhook_name, embed=embed, file_bytes=piece_image, file_name=image_name)
             return
         send_to_webhook(webhook_name=webhook_name, embed=embed)
 
@@ -378,238 +385,246 @@ class AuctionScanner:
               f"Piece: {(seymour_piece.item_id, seymour_piece.item_uuid, seymour_piece.hex_code)}")
 
         piece_image = create_armor_image(seymour_piece)
-        piece_image.save("a/armor_piece.png")
 
         embed = DiscordEmbed(title=auction['item_name'], url=f"https://sky.coflnet.com/auction/{auction['uuid']}", color=seymour_piece.hex_code)
         embed.set_author(name=seller_ign, icon_url=f"https://crafatar.com/renders/head/{auction['auctioneer']}")
-        embed.set_thumbnail(url="attachment://armor_image.png")
+        image_name = f"{seymour_piece.item_id.lower()}_{seymour_piece.hex_code}.png"
+        embed.set_thumbnail(url=f"attachment://{image_name}")
         embed.add_embed_field(name="Hex", value=f"#{seymour_piece.hex_code}", inline=True)
         embed.add_embed_field(name="Price" if auction['bin'] else "Starting Bid", value=self.human_format(auction['starting_bid']), inline=True)
         embed.add_embed_field(name="Closest Armor Pieces", value="\n".join(closest_list_printable), inline=False)
         embed.set_footer(text=f"/viewauction {auction['uuid']}")
 
+        if self.dupe_pool is not None:
+            message = send_to_webhook(webhook_name="seymour", content=content, embed=embed, file_bytes=piece_image,
+                                      file_name=image_name, batchable=False)
+            self.dupe_pool.submit(self.edit_in_dupes, message, seymour_piece)
+            return
+
         dupes = self.find_dupes(seymour_piece.hex_code, seymour_piece.item_uuid)
         if len(dupes):
-            dupes_joined = f"{len(dupes)} match(es) found!"
-            for dupe in dupes:
-                dupes_joined += dupe
-            embed.set_description(dupes_joined)
+            embed.set_description(self.dupes_description(dupes))
 
-        send_to_webhook(webhook_name="seymour", content=content, embed=embed, file_path="a/armor_piece.png")
+        send_to_webhook(webhook_name="seymour", content=content, embed=embed, file_bytes=piece_image, file_name=image_name)
+
+    @staticmethod
+    def dupes_description(dupes):
+        dupes_joined = f"{len(dupes)} match(es) found!"
+        for dupe in dupes:
+            dupes_joined += dupe
+        return dupes_joined
 
+    def edit_in_dupes(self, message, seymour_piece: SeymourPiece):
+        try:
+            dupes = self.find_dupes(seymour_piece.hex_code, seymour_piece.item_uuid)
+            if not len(dupes):
+                return
+            embed = copy.deepcopy(message.embed)  # the original might not have been sent yet
+            embed.set_description(self.dupes_description(dupes))
+            webhook_dispatcher.enqueue_edit("seymour", message, content=message.content, embed=embed)
+        except Exception as e:
+            print(e)
+            traceback.print_tb(e.__traceback__)
+
+    @metrics.timed("stage_seconds", stage="find_dupes")
     def find_dupes(self, hex_code, item_uuid):
-        dupes = self.db.matching_hexes(hex_code, item_uuid)
+        db = database.SeymourDatabase()  # runs on the dupe pool when defer_dupe_details is on
+        dupes = db.matching_hexes(hex_code, item_uuid)
         if dupes is None or not len(dupes):
             return []
         print(f"{len(dupes)} match(es) found!")
 
-        scanner = PlayerScanner()
+        dupes_by_owner = defaultdict(list)
+        for dupe in dupes:
+            dupes_by_owner[dupe[2]].append(dupe)
+        resolved = {}
+        with ThreadPoolExecutor(max_workers=DUPE_RESOLUTION_WORKERS) as executor:
+            for owner_resolved in executor.map(self.resolve_owner_dupes, dupes_by_owner.items()):
+                resolved.update(owner_resolved)
+
+        updated_pieces = [x[2] for x in resolved.values() if x[2] is not None]
+        if len(updated_pieces):
+            db.add_items_to_db(updated_pieces)
+        owner_names = get_names_for_uuids(x[1] for x in resolved.values())
+
         printable_dupes = []
+        for dupe in dupes:
+            if dupe[1] not in resolved:
+                continue
+            item_id, owner, piece = resolved[dupe[1]]
+            printable_dupes.append(f"\n{item_id.replace('_', ' ').title()} last owned by {owner_names[owner]}")  # this handles transmutation YEP (3 days later i forgot what this joke means)
+            print(f"Last Known Owner: {owner_names[owner]}, Piece: {piece or dupe}")
+        return printable_dupes
+
+    @staticmethod
+    def resolve_owner_dupes(owner_dupes):
+        # one profile download per owner, however many of the dupes they hold.
+        # returns item_uuid -> (item_id, last known owner, piece to save or None)
+        owner, dupes = owner_dupes
+        resolved = {}
+        try:
+            scanner = PlayerScanner()
+            seymour_list = scanner.get_profile(owner, use_i_tem=True)
+            scanner.process_seymour_list(seymour_list, owner, sort_by_closest=False)  # add findings to db
+        except Exception as e:
+            print(e)
+            traceback.print_tb(e.__traceback__)
+            return resolved
+
         for dupe in dupes:
             try:
-                seymour_list = scanner.get_profile(dupe[2], use_i_tem=True)
-                scanner.process_seymour_list(seymour_list, dupe[2], sort_by_closest=False)  # add findings to db
                 if dupe[1] in seymour_list:
-                    owner_ign, _ = get_name_and_uuid(input_uuid=dupe[2])
-                    printable_dupes.append(f"\n{dupe[0].replace('_', ' ').title()} last owned by {owner_ign}")
-                    print(f"Last Known Owner: {owner_ign}, Piece: {dupe}")
+                    resolved[dupe[1]] = (dupe[0], owner, None)
                     continue
 
                 item_info = get_json(f"https://api.tem.cx/items/{dupe[1]}")
                 if not item_info['success']:
-                    owner_ign, _ = get_name_and_uuid(input_uuid=dupe[2])
-                    printable_dupes.append(f"\n{dupe[0].replace('_', ' ').title()} last owned by {owner_ign}")
-                    print(f"Last Known Owner: {owner_ign}, Piece: {dupe}")
+                    resolved[dupe[1]] = (dupe[0], owner, None)
                     continue
                 item_info = item_info['item']
                 if item_info['lastChecked'] > dupe[4]:  # given the previous lot failed, this will always be true... but eh
                     piece = SeymourPieceWithOwnership(SeymourPiece(item_info['itemId'], item_info['_id'],
                                                       item_info['colour']), item_info['currentOwner']['playerUuid'],
                                                       item_info['location'].replace("backpack-", "backpack_contents_"), int(item_info['lastChecked'] / 1000))
-                    self.db.add_item_to_db(piece)
-                    owner_ign, _ = get_name_and_uuid(input_uuid=item_info['currentOwner']['playerUuid'])
-                    printable_dupes.append(f"\n{item_info['itemId'].replace('_', ' ').title()} last owned by {owner_ign}")  # this handles transmutation YEP (3 days later i forgot what this joke means)
-                    print(f"Last Known Owner: {owner_ign}, Piece: {piece}")
+                    resolved[dupe[1]] = (item_info['itemId'], piece.owner, piece)
             except Exception as e:
                 print(e)
                 traceback.print_tb(e.__traceback__)
-        return printable_dupes
+        return resolved
 
     @staticmethod
     def get_nbt_data(item_bytes):
-        nbt_data = nbt.read_from_nbt_file(file=BytesIO(b64decode(item_bytes)))
-        return nbt_data.json_obj(full_json=False)
+        # only the fields in nbt_reader.ITEM_FIELDS, add to it before reading anything new here
+        return nbt_reader.read_item_bytes(item_bytes)
 
-    @staticmethod
-    def timestamp_to_museum_unix(timestamp, use_dst: bool = True):
-        if ":" not in timestamp:
-            unix_timestamp = int(timestamp) / 1000
-            if use_dst:
-                unix_timestamp -= 3600  # All Unix timestamps were created on June 11th/12th, no need to DST check!
-            return int(unix_timestamp), True
-        elif "AM" not in timestamp and "PM" not in timestamp:
-            glitched = True
-            month, day, year = list(map(int, timestamp[0:8].split("/")))
-            year += 2000
-
-            while month > 12:
-                month -= 12
-                year += 1
-
-            # actual_date = datetime.strptime(timestamp, "%d/%m/%y %H:%M")
-            museum_date = datetime.strptime(f"{month}/{day}/{year} {timestamp[9:]}", "%m/%d/%Y %H:%M")
-        else:
-            glitched = False
-            museum_date = datetime.strptime(timestamp, "%m/%d/%y %I:%M %p")
-
-        if use_dst:
-            fuck_hypixel = timezone('US/Eastern').localize(museum_date).dst() != timedelta(0)
-            if fuck_hypixel:
-                museum_date -= timedelta(hours=1)
-
-        return int(museum_date.timestamp()), glitched
+    timestamp_to_museum_unix = staticmethod(timestamps.timestamp_to_museum_unix)
 
+    @metrics.timed("stage_seconds", stage="museum")
     def museum_bullshit(self, museum_queue):
-        i_tem_scan_queue = {"items": []}
+        position_keys = []
         for item in museum_queue.copy():
             item_id = item['item_id'].replace("STARRED_", "")
             item_timestamp = item['timestamp']
 
-            if item_id not in oldest_items:
+            record = museum_records.get(item_id)
+            if record is None:
                 museum_queue.remove(item)
                 continue
 
-            if "first_four_digit" in oldest_items[item_id]:
-                if oldest_items[item_id]["first_four_digit"]["timestamp"] <= item_timestamp:
+            if "first_four_digit" in record:
+                if record["first_four_digit"]["timestamp"] <= item_timestamp:
                     museum_queue.remove(item)
                     continue
 
-            item_dict = {"itemId": item_id, "creation": item_timestamp * 1000}
-            print(item_dict)
-            i_tem_scan_queue['items'].append(item_dict)
-            if item_id in ["STONE_BLADE", "ADAPTIVE_BOOTS", "ADAPTIVE_CHESTPLATE", "ADAPTIVE_HELMET", "ADAPTIVE_LEGGINGS", "BONZO_MASK", "BONZO_STAFF", "LAST_BREATH", "SHADOW_ASSASSIN_BOOTS", "SHADOW_ASSASSIN_CHESTPLATE", "SHADOW_ASSASSIN_HELMET", "SHADOW_ASSASSIN_LEGGINGS", "SHADOW_FURY", "SPIDER_QUEENS_STINGER", "VENOMS_TOUCH", "SPIRIT_MASK", "THORNS_BOOTS", "BAT_WAND", "ITEM_SPIRIT_BOW", "BONE_BOOMERANG", "FELTHORN_REAPER"]:
-                item_dict = {"itemId": f"STARRED_{item_id}", "creation": item_timestamp * 1000}
-                i_tem_scan_queue['items'].append(item_dict)
+            print({"itemId": item_id, "creation": item_timestamp * 1000})
+            position_keys.append((item_id, item_timestamp * 1000))
+            if item_id in STARRED_POSITION_ITEMS:
+                position_keys.append((f"STARRED_{item_id}", item_timestamp * 1000))
             elif "STARRED_" in item_id:
-                item_dict = {"itemId": item_id.replace("STARRED_", ""), "creation": item_timestamp * 1000}
-                i_tem_scan_queue['items'].append(item_dict)
+                position_keys.append((item_id.replace("STARRED_", ""), item_timestamp * 1000))
 
-        if not len(i_tem_scan_queue['items']):
+        if not len(position_keys):
             return
 
-        post_data = json.dumps(i_tem_scan_queue)
-        i_tem_resp = requests.post(url="https://api.tem.cx/items/position", data=post_data)
-        position_data = i_tem_resp.json()
-        formatted_data = {}
-        for item in position_data['positions']:
-            if item['itemId'] in formatted_data:
-                if item['creation'] in formatted_data[item['itemId']]:
-                    continue
-                formatted_data[item['itemId']][item['creation']] = item['highest']
-                continue
-            formatted_data[item['itemId']] = {}
-            formatted_data[item['itemId']][item['creation']] = item['highest']
-
-        print(formatted_data)
+        positions = i_tem_positions.lookup(position_keys)  # cached, batched, gives up quietly when iTEM is struggling
+        print(positions)
 
         for item in museum_queue:
             item_id = item['item_id'].replace("STARRED_", "")
 
             try:
-                position = formatted_data[item_id][item['timestamp'] * 1000]
+                position = positions[(item_id, item['timestamp'] * 1000)]
+                if item_id in STARRED_POSITION_ITEMS:
+                    position += positions[(f"STARRED_{item_id}", item['timestamp'] * 1000)]
+                    position -= 1
             except KeyError:
                 print(item)
                 continue
-            if item_id in ["STONE_BLADE", "ADAPTIVE_BOOTS", "ADAPTIVE_CHESTPLATE", "ADAPTIVE_HELMET", "ADAPTIVE_LEGGINGS", "BONZO_MASK", "BONZO_STAFF", "LAST_BREATH", "SHADOW_ASSASSIN_BOOTS", "SHADOW_ASSASSIN_CHESTPLATE", "SHADOW_ASSASSIN_HELMET", "SHADOW_ASSASSIN_LEGGINGS", "SHADOW_FURY", "SPIDER_QUEENS_STINGER", "VENOMS_TOUCH", "SPIRIT_MASK", "THORNS_BOOTS", "BAT_WAND", "ITEM_SPIRIT_BOW", "BONE_BOOMERANG", "FELTHORN_REAPER"]:
-                position += formatted_data[f"STARRED_{item_id}"][item['timestamp'] * 1000]
-                position -= 1
 
-            if item['timestamp'] < oldest_items[item_id]["first"]['timestamp']:
-                oldest_items[item_id]["first"] = {"edition": position, "timestamp": item['timestamp']}
+            record = museum_records.get(item_id)
+            if item['timestamp'] < record["first"]['timestamp']:
+                museum_records.set(item_id, "first", {"edition": position, "timestamp": item['timestamp']})
                 print(f"New Oldest {item_id} Found! edition: {position}, timestamp: {item['timestamp']}")
             if position > 1000:
-                oldest_items[item_id]["first_four_digit"] = {"edition": position, "timestamp": item['timestamp']}
+                museum_records.set(item_id, "first_four_digit", {"edition": position, "timestamp": item['timestamp']})
                 continue
-            if item['timestamp'] - oldest_items[item_id]["first"]['timestamp'] > 2419200:  # 28 days
+            if item['timestamp'] - record["first"]['timestamp'] > 2419200:  # 28 days
                 print(f"Unsent {item_id}! edition: {position}, timestamp: {item['timestamp']}, auc id: {item['auction']['uuid']}")
                 continue
             self.send_item_to_webhook(item['auction'], item['item_nbt'], "maybe good museum item??", position)
 
     def find_items(self, auction_page):
+        self.find_items_in_pages([auction_page])
+
+    def new_auctions(self, auction_page):
         if len(auction_page['auctions']) == 0:
             print(f"Empty auctions page: {json.dumps(auction_page, indent=4)}")
+            return []
+        new_auctions = self.seen_auctions.filter_new(auction_page['auctions'])
+        metrics.inc("auctions_scanned_total", len(new_auctions), result="decoded")
+        metrics.inc("auctions_scanned_total", len(auction_page['auctions']) - len(new_auctions), result="skipped")
+        return new_auctions
+
+    def classified_pages(self, auction_pages):
+        # decoding and classifying happens in the process pool if there is one, side effects stay in this process
+        if self.decode_pool is None:
+            for auction_page in auction_pages:
+                auctions = self.new_auctions(auction_page)
+                with metrics.timer("stage_seconds", stage="decode_classify"):
+                    hits = auction_classifier.classify_auctions(auctions)
+                yield hits
             return
+        pending = set()
+        for auction_page in auction_pages:
+            pending.add(self.decode_pool.submit(auction_classifier.classify_auctions, self.new_auctions(auction_page)))
+            for future in [x for x in pending if x.done()]:
+                pending.remove(future)
+                yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+    def find_items_in_pages(self, auction_pages):
         museum_queue = []
-        filtered_auctions = [auc for auc in auction_page['auctions'] if auc['start'] > self.prev_update and not auc['claimed']]
-        for auction in filtered_auctions:
-            try:
-                nbt_data = self.get_nbt_data(auction['item_bytes'])
-            except ValueError:
+        page_count = 0
+        for hits in self.classified_pages(auction_pages):
+            page_count += 1
+            for hit in hits:
+                self.handle_hit(hit, museum_queue)
+
+        self.museum_bullshit(museum_queue)  # museum_records saves itself in the background
+        return page_count
+
+    def handle_hit(self, hit, museum_queue):
+        auction, nbt_data, item_id = hit['auction'], hit['nbt'], hit['item_id']
+        metrics.inc("auction_hits_total", reason=hit['reason'])
+        if hit['reason'] == auction_classifier.SEYMOUR_PIECE:
+            seymour_piece = SeymourPiece(item_id, nbt_data["i"][0]["tag"]["ExtraAttributes"]['uuid'], hit['extra'])
+            self.build_seymour_embed(seymour_piece, auction)
+            ownership = SeymourPieceWithOwnership(seymour_piece, auction['auctioneer'], "auction_house", int(auction['start'] / 1000))
+            self.db.add_item_to_db(ownership)
+        elif hit['reason'] == auction_classifier.MUSEUM_CANDIDATE:
+            museum_queue.append({"item_nbt": nbt_data, "auction": auction, "item_id": item_id, "timestamp": hit['extra']})
+        else:
+            if hit['reason'] == "glitched timestamp":
+                print(f"[{datetime.now().strftime('%X')}] Glitched Timestamp Found!", auction)
+            self.send_item_to_webhook(auction, nbt_data, hit['reason'], hit['extra'])
+
+    def auction_pages(self, first_page):
+        # pages are yielded as they finish downloading, not in page order
+        total_pages = first_page.get('totalPages', 1)
+        futures = [http.submit(http.request_json("GET", f"{self.API_URL}/skyblock/auctions?page={i}"))
+                   for i in range(1, total_pages)]
+        yield first_page
+        for future in as_completed(futures):
+            page = future.result()
+            if page is None or not page.get('success', True):
                 continue
-
-            attributes = nbt_data["i"][0]["tag"].get("ExtraAttributes")
-            if not attributes:
+            if page.get('lastUpdated') != first_page['lastUpdated']:  # api refreshed mid-sweep, next sweep gets these
                 continue
+            yield page
 
-            item_id = attributes["id"]
-            match item_id:
-                case 'VELVET_TOP_HAT' | "CASHMERE_JACKET" | "SATIN_TROUSERS" | "OXFORD_SHOES":
-                    seymour_piece = SeymourPiece(item_id, attributes['uuid'], hex(nbt_data["i"][0]["tag"]["display"]["color"]).replace("0x", "").upper().rjust(6, '0'))
-                    self.build_seymour_embed(seymour_piece, auction)
-                    ownership = SeymourPieceWithOwnership(seymour_piece, auction['auctioneer'], "auction_house", int(auction['start'] / 1000))
-                    self.db.add_item_to_db(ownership)
-                case 'PARTY_HAT_CRAB' | 'PARTY_HAT_CRAB_ANIMATED':
-                    year_created = attributes.get("party_hat_year")
-                    if year_created and str(year_created) in ("2021", "2023"):
-                        self.send_item_to_webhook(auction, nbt_data, "2023 crab hat")
-                case 'REINFORCED_IRON_ARROW' | 'GOLD_TIPPED_ARROW' | 'REDSTONE_TIPPED_ARROW' | 'EMERALD_TIPPED_ARROW' | 'BOUNCY_ARROW' | 'ICY_ARROW' | 'ARMORSHRED_ARROW' | 'EXPLOSIVE_ARROW' | 'GLUE_ARROW' | 'NANSORB_ARROW':
-                    self.send_item_to_webhook(auction, nbt_data, "funny jax arrow")
-                case 'SALMON_HAT':
-                    if "raffle_win" not in attributes:
-                        self.send_item_to_webhook(auction, nbt_data, "cool kid salmon hat")
-                case 'MIDAS_SWORD' | 'MIDAS_STAFF':
-                    if "winning_bid" in attributes:
-                        if attributes['winning_bid'] < 1000000:
-                            self.send_item_to_webhook(auction, nbt_data, "cheapskate midas")
-                    else:
-                        self.send_item_to_webhook(auction, nbt_data, "no bid midas gaming")
-
-            if item_id in DUNGEON_ITEM_LIST:
-                if "baseStatBoostPercentage" not in attributes:
-                    if "item_tier" not in attributes:
-                        self.send_item_to_webhook(auction, nbt_data, "clean dungeons drop")
-                    else:
-                        self.send_item_to_webhook(auction, nbt_data, "0% dungeons drop")
-
-            reforge = attributes.get("modifier")
-            if reforge and str(reforge) in OG_REFORGE_LIST and auction['category'] != "accessories":
-                self.send_item_to_webhook(auction, nbt_data, f"{reforge} reforge")
-
-            origin_tag = attributes.get("originTag")
-            if origin_tag and str(origin_tag) in ["ITEM_MENU", "ITEM_COMMAND"]:
-                self.send_item_to_webhook(auction, nbt_data, "admin-spawned item")
-
-            item_timestamp = attributes.get("timestamp")
-            if item_timestamp:
-                unix_timestamp, glitched = self.timestamp_to_museum_unix(str(item_timestamp), use_dst=False)
-                if glitched:
-                    print(f"[{datetime.now().strftime('%X')}] Glitched Timestamp Found!", auction)
-                    self.send_item_to_webhook(auction, nbt_data, "glitched timestamp")
-                museum_queue.append({"item_nbt": nbt_data, "auction": auction, "item_id": item_id, "timestamp": unix_timestamp})
-
-            minecraft_id = nbt_data["i"][0]["id"]
-            if minecraft_id in (298, 299, 300, 301):
-                exotic_type = exotics.get_exotic_type(nbt_data)
-                if exotic_type != "DEFAULT":
-                    self.send_item_to_webhook(auction, nbt_data, "epic exotic", exotic_type)
-
-        self.museum_bullshit(museum_queue)
-        with open("museum_info.json", "w") as museum_file:
-            json.dump(oldest_items, museum_file, indent=2)
-
-    def first_check(self, total_pages):
-        for i in range(total_pages):
-            c = get_json(f"https://api.hypixel.net/skyblock/auctions?page={i}")
+    def first_check(self, first_page):
+        for c in self.auction_pages(first_page):
             s = time.time_ns()
             for auction in c['auctions']:
                 try:
@@ -623,20 +638,28 @@ class AuctionScanner:
                     continue
 
                 unix_timestamp = self.timestamp_to_museum_unix(item_timestamp, use_dst=False)[0]
-                if item_id in oldest_items:
-                    if unix_timestamp < oldest_items[item_id]['oldest']:
-                        oldest_items[item_id]['oldest'] = unix_timestamp
-                else:
-                    oldest_items[item_id] = {}
-                    oldest_items[item_id]['oldest'] = unix_timestamp
-            print(f"Page {i} completed in {(time.time_ns() - s) / 1e6}ms")
-        print(oldest_items)
+                record = museum_records.get(item_id)
+                if record is None or unix_timestamp < record['oldest']:
+                    museum_records.set(item_id, 'oldest', unix_timestamp)
+            print(f"Page {c.get('page')} completed in {(time.time_ns() - s) / 1e6}ms")
+        print(f"{museum_records.flush()} museum records updated")
+
+    def seed_seen_auctions(self, first_page):
+        # cold start, everything already listed counts as seen like it did with the start time filter
+        for auction_page in self.auction_pages(first_page):
+            self.seen_auctions.filter_new(auction_page['auctions'])
+        self.seen_auctions.end_sweep(first_page['lastUpdated'], first_page.get('totalPages'))
+        print(f"[{datetime.now().strftime('%X')}] Seeded {len(self.seen_auctions)} seen auctions")
 
     def scan_auctions_loop(self):
         c = get_json(f"https://api.hypixel.net/skyblock/auctions?page=0")
+        while c is None:
+            time.sleep(0.5)
+            c = get_json(f"https://api.hypixel.net/skyblock/auctions?page=0")
         self.prev_update = c['lastUpdated']
-        # total_pages = c['totalPages']
-        # self.first_check(total_pages)
+        if not len(self.seen_auctions):
+            self.seed_seen_auctions(c)
+        # self.first_check(c)
         while True:
             download_start = time.time_ns()
             auction_api = get_json(f"https://api.hypixel.net/skyblock/auctions?page=0")
@@ -650,57 +673,61 @@ class AuctionScanner:
                 continue
 
             find_start = time.time_ns()
-            self.find_items(auction_api)
+            if getattr(config, "scan_all_pages", True):
+                pages, total_pages = self.auction_pages(auction_api), auction_api.get('totalPages')
+            else:
+                pages, total_pages = [auction_api], None
+            page_count = self.find_items_in_pages(pages)
+            counts = self.seen_auctions.end_sweep(auction_api['lastUpdated'], total_pages)
             find_end = time.time_ns()
             self.prev_update = auction_api['lastUpdated']
+            metrics.observe("stage_seconds", (download_end - download_start) / 1e9, stage="first_page_download")
+            metrics.observe("stage_seconds", (find_end - find_start) / 1e9, stage="refresh")
+            for change, amount in counts.items():
+                metrics.inc("auction_changes_total", amount, change=change)
             print(f"[{datetime.now().strftime('%X')}] Refresh completed! "
                   f"Download: {(download_end - download_start) / 1e6}ms | "
-                  f"Processing: {(find_end - find_start) / 1e6}ms")
+                  f"Processing: {(find_end - find_start) / 1e6}ms ({page_count} pages) | "
+                  f"{counts['new']} new, {counts['updated']} updated, {counts['ended']} ended")
             print(f"[{datetime.now().strftime('%X')}] "
                   f"Sleeping for {int(60 - (time.time() - (self.prev_update / 1000)))} seconds...")
             time.sleep(max(int(60 - (time.time() - (self.prev_update / 1000))), 1))
 
 
 class PlayerScanner:
+    @metrics.timed("stage_seconds", stage="get_profile")
     def get_profile(self, uuid, use_i_tem=True):
-        s = time.time_ns()
-        player = get_json(f"https://api.hypixel.net/skyblock/profiles?uuid={uuid}&key={config.api_key}")
-        if player is None:
-            return {}
-        if player.get('profiles') is None:
-            return {}
-        print(f"Download from Hypixel {(time.time_ns() - s) / 1e6}ms")
+        with ThreadPoolExecutor(max_workers=INVENTORY_DECODE_WORKERS) as executor:
+            i_tem_future = executor.submit(self.get_i_tem_data, uuid) if use_i_tem else None
+            s = time.time_ns()
+            player = get_json(f"https://api.hypixel.net/skyblock/profiles?uuid={uuid}&key={config.api_key}")
+            if player is None:
+                return {}
+            if player.get('profiles') is None:
+                return {}
+            print(f"Download from Hypixel {(time.time_ns() - s) / 1e6}ms")
 
+            s = time.time_ns()
+            inventories = []
+            for profile in player['profiles']:
+                if uuid not in profile['members']:
+                    continue
+                member = profile['members'][uuid]
+                for menu in INVENTORY_MENUS:
+                    if menu == "backpack_contents":
+                        for i, backpack in (member.get(menu) or {}).items():
+                            inventories.append((backpack, f"{menu}_{i}"))
+                    elif member.get(menu) is not None:
+                        inventories.append((member[menu], menu))
+            results = list(executor.map(lambda x: self.get_inventory(*x), inventories))
+            print(f"Process Hypixel data {(time.time_ns() - s) / 1e6}ms")
+            if i_tem_future is not None:
+                results.append(i_tem_future.result())
+
+        # the first inventory a piece shows up in wins, iTEM goes last
         seymour_list = {}
-        s = time.time_ns()
-        for profile in player['profiles']:
-            if uuid not in profile['members']:
-                continue
-            for menu in ["inv_contents", "inv_armor", "wardrobe_contents", "ender_chest_contents",
-                         "backpack_contents", "personal_vault_contents"]:
-                if menu == "backpack_contents":
-                    backpacks = profile['members'][uuid].get(menu)
-                    if backpacks is None:
-                        continue
-                    for i, backpack in backpacks.items():
-                        inventory = self.get_inventory(backpack, f"{menu}_{i}")
-                        if inventory is not None:
-                            inventory.update(seymour_list)
-                            seymour_list = inventory
-                else:
-                    inventory_bytes = profile['members'][uuid].get(menu)
-                    if inventory_bytes is None:
-                        continue
-                    inventory = self.get_inventory(inventory_bytes, menu)
-                    if inventory is not None:
-                        inventory.update(seymour_list)
-                        seymour_list = inventory
-        print(f"Process Hypixel data {(time.time_ns() - s) / 1e6}ms")
-        if use_i_tem:
-            inventory = self.get_i_tem_data(uuid=uuid)
-            if inventory is not None:
-                inventory.update(seymour_list)
-                seymour_list = inventory
+        for inventory in reversed(results):
+            seymour_list.update(inventory)
         return seymour_list
 
     @staticmethod
@@ -709,14 +736,16 @@ class PlayerScanner:
         if inventory.get('data') is None:
             return {}
         try:
-            decoded = nbt.read_from_nbt_file(file=BytesIO(b64decode(inventory['data'])))
-        except Exception as e:
+            data = nbt_reader.decompress(inventory['data'])
+            if not any(x in data for x in SEYMOUR_ID_BYTES):  # most inventories don't have any, skip parsing those
+                return {}
+            decoded = nbt_reader.read_nbt(data, nbt_reader.COMPILED_INVENTORY_FIELDS)
+        except ValueError as e:
             print("Something went wrong! " + str(e))
             print(inventory_name)
             return {}
-        decoded = decoded.json_obj(full_json=False)
 
-        for item in decoded['i']:
+        for item in decoded.get('i', []):
             item = item.get("tag")
             if item is None:
                 continue
@@ -724,8 +753,7 @@ class PlayerScanner:
                 continue
             if 'id' not in item['ExtraAttributes']:
                 continue
-            if str(item['ExtraAttributes']['id']) not in (
-                    "VELVET_TOP_HAT", "CASHMERE_JACKET", "SATIN_TROUSERS", "OXFORD_SHOES"):
+            if str(item['ExtraAttributes']['id']) not in auction_classifier.SEYMOUR_ITEM_IDS:
                 continue
             hex_code = hex(item['display']['color']).replace("0x", "").upper().rjust(6, '0')
 
@@ -745,7 +773,7 @@ class PlayerScanner:
         s = time.time_ns()
 
         i_item_list = get_json(url)
-        if i_item_list is None:
+        if i_item_list is None or i_item_list.get('items') is None:
             return {}
 
         print(f"Download from iTEM {(time.time_ns() - s) / 1e6}ms")
@@ -753,7 +781,7 @@ class PlayerScanner:
         s = time.time_ns()
 
         for item in i_item_list['items']:
-            if item['itemId'] not in ("VELVET_TOP_HAT", "CASHMERE_JACKET", "SATIN_TROUSERS", "OXFORD_SHOES"):
+            if item['itemId'] not in auction_classifier.SEYMOUR_ITEM_IDS:
                 continue
             seymour_list[item['_id']] = {
                 "item_id": item['itemId'],
@@ -762,27 +790,25 @@ class PlayerScanner:
                 "location": item['location'].replace("backpack-", "backpack_contents_"),
                 "hex": item['colour']
             }
-            return seymour_list
         print(f"Process iTEM data {(time.time_ns() - s) / 1e6}ms")
+        return seymour_list
 
     @staticmethod
+    @metrics.timed("stage_seconds", stage="process_seymour_list")
     def process_seymour_list(seymour_list, uuid, sort_by_closest=True):
-        # SLOW
-        db = SeymourDatabase()
+        db = database.SeymourDatabase()
         pieces = []
         for item in seymour_list.values():
             seymour_piece = SeymourPiece(item['item_id'], item['uuid'], item['hex'])
             ownership_piece = SeymourPieceWithOwnership(seymour_piece, uuid, item['location'], item['last_seen'])
             pieces.append(ownership_piece)
 
-            if not sort_by_closest:
-                continue
-            closest_item = find_closest_skyblock_piece(seymour_piece, length=1)[0]
-            item['closest'] = closest_item
-
         sorted_list = list(seymour_list.values())
         if sort_by_closest:
-            sorted_list = sorted(list(seymour_list.values()), key=lambda x: x['closest'][1])
+            closest_items = find_closest_skyblock_pieces([x.piece for x in pieces], length=1)
+            for item, closest_item in zip(sorted_list, closest_items):
+                item['closest'] = closest_item[0]
+            sorted_list = sorted(sorted_list, key=lambda x: x['closest'][1])
 
         db.add_items_to_db(pieces)
 
@@ -816,10 +842,10 @@ async def compare(
 ):
     await inter.response.defer()
 
-    rgb = tuple(int(hex_code_1[i:i + 2], 16) for i in (0, 2, 4))
+    rgb = color.unpack_rgb(int(hex_code_1, 16))
     xyz = color.rgb_to_xyz(rgb)
     lab1 = color.xyz_to_cielab(xyz)
-    rgb = tuple(int(hex_code_2[i:i + 2], 16) for i in (0, 2, 4))
+    rgb = color.unpack_rgb(int(hex_code_2, 16))
     xyz = color.rgb_to_xyz(rgb)
     lab2 = color.xyz_to_cielab(xyz)
 
@@ -862,8 +888,7 @@ async def closest(
     seymour_piece = SeymourPiece(armor_type, "", hex_code)
     closest_list = find_closest_skyblock_piece(seymour_piece, length=3, new_method=new_method)
 
-    piece = create_armor_image(seymour_piece)
-    piece.save("a/armor_piece.png")
+    piece_image = create_armor_image(seymour_piece)
 
     embed = disnake.Embed(
         title=f"Closest SkyBlock pieces to hex code #{hex_code.upper()}:",
@@ -872,7 +897,7 @@ async def closest(
                     f"{closest_list[2][0]}: {round(closest_list[2][1], 2)}",
         colour=int(hex_code, 16)
     )
-    embed.set_thumbnail(file=disnake.File("a/armor_piece.png"))
+    embed.set_thumbnail(file=disnake.File(BytesIO(piece_image), filename="armor_image.png"))
     await inter.edit_original_message(embed=embed)
 
 
@@ -883,10 +908,11 @@ async def closest(
 )
 async def earliest_known(inter: disnake.AppCommandInteraction, item_id: str):
     await inter.response.defer()
-    if item_id not in oldest_items:
+    record = await asyncio.to_thread(museum_records.get, item_id)
+    if record is None:
         await inter.edit_original_message("unknown item id, please check your spelling and try again. newer/non-museumable items may not be supported.")
         return
-    await inter.edit_original_message(embed=disnake.Embed(title=item_id, description=f"the oldest {item_id} i've seen was created on <t:{oldest_items[item_id]['first']['timestamp']}> (<t:{oldest_items[item_id]['first']['timestamp']}:R>), and is estimated to be position {oldest_items[item_id]['first']['edition']}"))
+    await inter.edit_original_message(embed=disnake.Embed(title=item_id, description=f"the oldest {item_id} i've seen was created on <t:{record['first']['timestamp']}> (<t:{record['first']['timestamp']}:R>), and is estimated to be position {record['first']['edition']}"))
 
 
 @bot.slash_command(
@@ -919,37 +945,22 @@ async def estimate_skyblock_time(inter: disnake.AppCommandInteraction):
 @commands.has_role('dw about it')
 async def find_closest_hex(inter: disnake.AppCommandInteraction, hex_code: str, item_id=None, owner=None, new_method: bool = True):
     await inter.response.defer()
-    dupes_con = sqlite3.connect("seymour_pieces.db")
-    dupes_cur = dupes_con.cursor()
+    await inter.edit_original_message(await asyncio.to_thread(closest_hex_response, hex_code, item_id, owner, new_method))
+
+
+def closest_hex_response(hex_code, item_id=None, owner=None, new_method=True):
+    dupes_db = database.SeymourDatabase()
 
     uuid = ""
     if owner:
         name, uuid = get_name_and_uuid(input_name=owner)
 
-    res = dupes_cur.execute("SELECT item_uuid,hex_code FROM seymour_pieces")
-    all_hexes = res.fetchall()
-    if all_hexes is None:
-        await inter.edit_original_message("it broke")
-        return
-
-    item_dict = {}
-    lab1 = color.hex_to_lab(hex_code)
-    for item in all_hexes:
-        lab2 = color.hex_to_lab(item[1])
-        if new_method:
-            similarity = color.compare_delta_e_2000(lab1, lab2)
-        else:
-            similarity = color.compare_delta_cie(lab1, lab2)
-        if similarity > 5:
-            continue
-        item_dict[item[0]] = similarity
+    item_dict = dict(dupes_db.pieces_near_lab(color.hex_to_lab(hex_code), 5, new_method=new_method))
 
-    res = dupes_cur.execute(f"SELECT * FROM seymour_pieces WHERE item_uuid IN ({','.join(['?'] * len(item_dict))})",
-                            tuple(item_dict.keys()))
-    good_items = res.fetchall()
+    good_items = dupes_db.fetchall(f"SELECT {database.PIECE_COLUMNS} FROM seymour_pieces WHERE item_uuid IN ({','.join(['?'] * len(item_dict))})",
+                                   tuple(item_dict.keys()))
     if good_items is None:
-        await inter.edit_original_message("it broke")
-        return
+        return "it broke"
     for item in good_items.copy():
         if item_id is not None and item[0] != item_id:
             good_items.remove(item)
@@ -968,11 +979,12 @@ async def find_closest_hex(inter: disnake.AppCommandInteraction, hex_code: str,
                             "Cashmere Jacket": [x for x in item_dict if x[0] == "CASHMERE_JACKET"],
                             "Satin Trousers": [x for x in item_dict if x[0] == "SATIN_TROUSERS"],
                             "Oxford Shoes": [x for x in item_dict if x[0] == "OXFORD_SHOES"]}
+        owner_names = get_names_for_uuids(item[2] for items in sorted_item_dict.values() for item in items[0:5])
         resp_string = ""
         for armor_type, items in sorted_item_dict.items():
             resp_string += armor_type + '\n'
             for count, item in enumerate(items[0:5]):
-                name, _ = get_name_and_uuid(item[2])
+                name = owner_names[item[2]]
                 temp = f"`{item[5]}` ({round(item[6], 2)}): {name}'s `{item[3]}` <t:{item[4]}:R>"
                 if count == 0:
                     temp += f" ({item[1]})"
@@ -981,7 +993,7 @@ async def find_closest_hex(inter: disnake.AppCommandInteraction, hex_code: str,
         resp_string = ""
         for item in item_dict[0:10]:
             resp_string += str(item) + '\n'
-    await inter.edit_original_message(resp_string)
+    return resp_string
 
 
 @bot.slash_command(
@@ -992,20 +1004,14 @@ async def find_closest_hex(inter: disnake.AppCommandInteraction, hex_code: str,
 @commands.default_member_permissions(administrator=True)
 async def check_dupes(inter: disnake.AppCommandInteraction, name=None):
     await inter.response.defer()
-    dupes_db = SeymourDatabase()
-    uuid = get_json(f"https://api.mojang.com/users/profiles/minecraft/{name}")['id']
+    uuid = None
     if name:
-        with dupes_db.con:
-            res = dupes_db.con.execute("SELECT * FROM seymour_pieces WHERE hex_code IN (SELECT hex_code FROM seymour_pieces WHERE owner = ?) AND hex_code IN (SELECT hex_code FROM seymour_pieces GROUP BY hex_code HAVING COUNT(DISTINCT owner) > 1 ) ORDER BY hex_code", (uuid,))
-            dupes = res.fetchall()
-            if dupes is None:
-                await inter.edit_original_message("found nothing L")
-    else:
-        with dupes_db.con:
-            res = dupes_db.con.execute("SELECT t.* FROM seymour_pieces t JOIN (SELECT hex_code FROM seymour_pieces GROUP BY hex_code HAVING COUNT(*) > 2 ) d ON t.hex_code = d.hex_code")
-            dupes = res.fetchall()
-            if dupes is None:
-                await inter.edit_original_message("found nothing L")
+        player_info = await http.fetch_json(f"https://api.mojang.com/users/profiles/minecraft/{name}")
+        if not player_info or 'id' not in player_info:
+            await inter.edit_original_message("found nothing L")
+            return
+        uuid = player_info['id']
+    dupes = await asyncio.to_thread(dupe_rows, uuid)
 
     dupes_sorted = {}
     for dupe in dupes:
@@ -1022,6 +1028,13 @@ async def check_dupes(inter: disnake.AppCommandInteraction, name=None):
     await inter.edit_original_message("does nothing mean nothing to you")
 
 
+def dupe_rows(owner_uuid=None):
+    dupes_db = database.SeymourDatabase()
+    if owner_uuid:
+        return dupes_db.owner_dupes(owner_uuid)
+    return dupes_db.dupe_report(min_pieces=3)
+
+
 @bot.slash_command(
     name="query",
     description="dw about it",
@@ -1029,11 +1042,7 @@ async def check_dupes(inter: disnake.AppCommandInteraction, name=None):
 )
 async def query(inter: disnake.AppCommandInteraction, db_query, params, length: int = 3, hidden: bool = False):
     await inter.response.defer(ephemeral=hidden)
-    dupes_con = sqlite3.connect("seymour_pieces.db")
-    dupes_cur = dupes_con.cursor()
-
-    res = dupes_cur.execute(db_query, (params,))
-    duplicates = res.fetchall()
+    duplicates = await asyncio.to_thread(query_rows, db_query, params)
     if duplicates is None:
         await inter.edit_original_message("you used it wrong go away")
         return
@@ -1045,6 +1054,10 @@ async def query(inter: disnake.AppCommandInteraction, db_query, params, length:
     await inter.edit_original_message(reply_message)
 
 
+def query_rows(db_query, params):
+    return database.SeymourDatabase().fetchall_read_only(db_query, (params,))
+
+
 @bot.slash_command(
     name="check_poifect",
     description="does absolutely nothing!",
@@ -1058,26 +1071,25 @@ async def check_perfect(inter: disnake.AppCommandInteraction):
     for armor_type, armor_data in default_hexes:
         hex_list_with_piece[armor_type] = {y['hex'] for x, y in armor_data.items()}
         hex_list += {y['hex'] for x, y in armor_data.items()}
-    perfect_db = SeymourDatabase()
-    with perfect_db.con:
-        res = perfect_db.con.execute(
-            f"SELECT * FROM seymour_pieces WHERE hex_code IN ({','.join(['?'] * len(hex_list))})", tuple(hex_list))
-        perfects = res.fetchall()
-        if perfects is None:
-            await inter.edit_original_message("none found")
-            return
+    perfects = await asyncio.to_thread(perfect_rows, hex_list)
+    if perfects is None:
+        await inter.edit_original_message("none found")
+        return
 
-        printable = ""
-        for item in perfects:
-            if item[-1] not in hex_list_with_piece[item[0]]:
-                continue
-            printable += item + "\n"
+    printable = ""
+    for item in perfects:
+        if item[-1] not in hex_list_with_piece[item[0]]:
+            continue
+        printable += item + "\n"
 
-    perfect_db.close_connection()
     print(perfects)
     await inter.edit_original_message("does nothing mean nothing to you")
 
 
+def perfect_rows(hex_list):
+    return database.SeymourDatabase().pieces_with_hexes(hex_list)
+
+
 @bot.slash_command(
     name="scan_player",
     description="Returns all of the Seymour's Special pieces owned by a player, sorted by similarity.",
@@ -1089,14 +1101,14 @@ async def scan_player(inter: disnake.AppCommandInteraction, input_name: str, len
     await inter.response.defer()
     print(f"Defer command {(time.time_ns() - s) / 1e6}ms")
     s = time.time_ns()
-    name, uuid = get_name_and_uuid(input_name=input_name)
+    name, uuid = await asyncio.to_thread(get_name_and_uuid, input_name=input_name)
     print(f"Get UUID from name {(time.time_ns() - s) / 1e6}ms")
 
     scanner = PlayerScanner()
-    seymour_list = scanner.get_profile(uuid, use_i_tem=include_item)
+    seymour_list = await asyncio.to_thread(scanner.get_profile, uuid, use_i_tem=include_item)
 
     s = time.time_ns()
-    seymour_list = scanner.process_seymour_list(seymour_list, uuid)
+    seymour_list = await asyncio.to_thread(scanner.process_seymour_list, seymour_list, uuid)
 
     print(f"Process Seymour list {(time.time_ns() - s) / 1e6}ms")
 
@@ -1122,49 +1134,21 @@ async def scan_player(inter: disnake.AppCommandInteraction, input_name: str, len
 )
 async def stab_seymour(inter: disnake.AppCommandInteraction):
     await inter.response.defer()
-    with open("museum_info.json", "w") as museum_file:
-        json.dump(oldest_items, museum_file, indent=2)
+    await asyncio.to_thread(museum_records.flush)
     await inter.edit_original_message("i am now dead, o7")
     exit(69)
 
 
 def main():
-    # with open("OXFORD_SHOES_0-81765.csv", "r") as csv_file:
-    #     csv_dict = csv.DictReader(csv_file)
-    #     line_count = 0
-    #     item_id = "OXFORD_SHOES"
-
-    #     seymour_list = []
-
-    #     for row in csv_dict:
-    #         if line_count == 0:
-    #             print(f"Column names are {', '.join(list(row.keys())[:-1])}")
-    #             line_count += 1
-    #             continue
-
-    #         item_hex_code = hex(int(row['colour'])).replace("0x", "").rjust(6, "0")
-    #         owner = row['currentOwner.playerUuid']
-    #         uuid = row['ï»¿_id']
-    #         datetime_obj = datetime.datetime.strptime(row['lastChecked'], "%a %b %d %H:%M:%S UTC %Y")
-    #         timestamp = datetime_obj.replace(tzinfo=datetime.timezone.utc).timestamp()
-    #         location = row['location'].replace("backpack-", "backpack_contents_")
-
-    #         seymour_piece = SeymourPieceWithOwnership(SeymourPiece(item_id, uuid, item_hex_code.upper()), owner, location, int(timestamp))
-    #         seymour_list.append(seymour_piece)
-    #         line_count += 1
-
-    # seymour_db = SeymourDatabase()
-    # count = 0
-    # while count < len(seymour_list):
-    #     abbr_list = seymour_list[count:min(count+1000, len(seymour_list))]
-    #     seymour_db.add_items_to_db(abbr_list)
-    #     print(f"at {count+1000} items")
-    #     count += 1000
-
-    # print(len(seymour_list))
-
-    # # seymour_db.add_items_to_db(seymour_list)
-    # exit()
+    if getattr(config, "metrics_port", None):
+        metrics.serve(config.metrics_port)
+    if getattr(config, "metrics_json_path", None):
+        metrics.start_dump(config.metrics_json_path, getattr(config, "metrics_dump_interval", metrics.DUMP_INTERVAL))
+
+    if not item_images:  # first ever start, there's no snapshot to fall back on yet
+        startup.revalidate_item_images(http)
+    Thread(target=startup.run_revalidator, args=(http,), name="item-images", daemon=True).start()
+
     finder = AuctionThread()
     finder.start()
 
@@ -0,0 +1,220 @@
+import json
+import os
+import time
+import traceback
+from bisect import bisect_left
+from contextlib import nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+# seconds, roughly prometheus' defaults with a few more at the slow end for iTEM
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DUMP_INTERVAL = 60
+
+# everything below is a no-op until enable() is called, the hot path only pays for the `if not enabled` check
+enabled = False
+lock = Lock()
+counters = {}
+gauges = {}
+histograms = {}
+gauge_callbacks = {}
+NOOP_TIMER = nullcontext()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def inc(name, amount=1, **labels):
+    if not enabled:
+        return
+    key = (name, label_key(labels))
+    with lock:
+        counters[key] = counters.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    if not enabled:
+        return
+    with lock:
+        gauges[(name, label_key(labels))] = value
+
+
+def observe(name, value, **labels):
+    if not enabled:
+        return
+    key = (name, label_key(labels))
+    with lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+        histogram[0][bisect_left(LATENCY_BUCKETS, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def register_gauge(name, callback, label=None):
+    # read when metrics are exported, for things like queue sizes that already know their own value.
+    # with a label the callback returns {label value: value}
+    gauge_callbacks[name] = (callback, label)
+
+
+class Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+def timer(name, **labels):
+    if not enabled:
+        return NOOP_TIMER
+    return Timer(name, labels)
+
+
+def timed(name, **labels):
+    # decorator version of timer, for stages that are a whole function
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with Timer(name, labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def collect_gauges():
+    collected = {}
+    for name, (callback, label) in list(gauge_callbacks.items()):
+        try:
+            value = callback()
+        except Exception as e:
+            print(f"Metrics gauge {name} failed: {str(e)}")
+            continue
+        if label is None:
+            collected[(name, ())] = value
+        else:
+            for label_value, x in value.items():
+                collected[(name, ((label, str(label_value)),))] = x
+    return collected
+
+
+def snapshot():
+    with lock:
+        counter_values = dict(counters)
+        gauge_values = dict(gauges)
+        histogram_values = {key: (list(buckets), total, count) for key, (buckets, total, count) in histograms.items()}
+    gauge_values.update(collect_gauges())
+
+    def rows(values, convert):
+        return [{"name": name, "labels": dict(labels), **convert(value)} for (name, labels), value in sorted(values.items())]
+
+    return {
+        "time": time.time(),
+        "counters": rows(counter_values, lambda x: {"value": x}),
+        "gauges": rows(gauge_values, lambda x: {"value": x}),
+        "histograms": rows(histogram_values, lambda x: {"buckets": dict(zip(map(str, LATENCY_BUCKETS + ("+Inf",)), x[0])),
+                                                        "sum": x[1], "count": x[2]}),
+    }
+
+
+def format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ""
+    escaped = (f'{x}="{escape(str(y))}"' for x, y in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus():
+    with lock:
+        counter_values = dict(counters)
+        histogram_values = {key: (list(buckets), total, count) for key, (buckets, total, count) in histograms.items()}
+        gauge_values = dict(gauges)
+    gauge_values.update(collect_gauges())
+
+    lines = []
+    for kind, values in (("counter", counter_values), ("gauge", gauge_values)):
+        seen = set()
+        for (name, labels), value in sorted(values.items()):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+    seen = set()
+    for (name, labels), (buckets, total, count) in sorted(histogram_values.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, bucket in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+            cumulative += bucket
+            lines.append(f"{name}_bucket{format_labels(labels, (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(labels)} {total}")
+        lines.append(f"{name}_count{format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = render_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(snapshot()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would drown out everything else
+
+
+def serve(port, host="127.0.0.1"):
+    # prometheus text on /metrics, the same numbers as json on /metrics.json
+    enable()
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_dump(path, interval=DUMP_INTERVAL):
+    enable()
+    Thread(target=run_dumper, args=(path, interval), name="metrics-dump", daemon=True).start()
+
+
+def run_dumper(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            temp_path = path + ".tmp"
+            with open(temp_path, "w") as w:
+                json.dump(snapshot(), w)
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"Failed to dump metrics: {str(e)}")
+            traceback.print_tb(e.__traceback__)
@@ -0,0 +1,69 @@
+import json
+import os
+import time
+import traceback
+from threading import Thread
+
+import database
+
+MUSEUM_JSON_PATH = "museum_info.json"
+FLUSH_INTERVAL = 30
+
+
+class MuseumStore:
+    # oldest known items, item_id -> {"first": {...}, "first_four_digit": {...}}. records are read from sqlite the
+    # first time they're asked for and only the changed ones get written back, from a background thread
+    def __init__(self, path=database.DATABASE_PATH, json_path=MUSEUM_JSON_PATH, flush_interval=FLUSH_INTERVAL):
+        self.con, self.lock = database.shared_connection(path)
+        self.records = {}
+        self.dirty = set()
+        with self.lock, self.con:
+            self.con.execute("CREATE TABLE IF NOT EXISTS museum_records (item_id TEXT PRIMARY KEY, record TEXT)")
+            empty = self.con.execute("SELECT 1 FROM museum_records LIMIT 1").fetchone() is None
+        if empty and json_path and os.path.exists(json_path):
+            self.import_json(json_path)
+        if flush_interval:
+            Thread(target=self.run_flusher, args=(flush_interval,), name="museum-flush", daemon=True).start()
+
+    def import_json(self, json_path):
+        # one off, from back when this lived in museum_info.json
+        with open(json_path, "r") as museum_file:
+            records = json.load(museum_file)
+        with self.lock, self.con:
+            self.con.executemany("INSERT OR REPLACE INTO museum_records VALUES (?, ?)",
+                                 [(item_id, json.dumps(record)) for item_id, record in records.items()])
+        print(f"Imported {len(records)} museum records from {json_path}")
+
+    def get(self, item_id):
+        with self.lock:
+            if item_id not in self.records:
+                row = self.con.execute("SELECT record FROM museum_records WHERE item_id = ?", (item_id,)).fetchone()
+                self.records[item_id] = json.loads(row[0]) if row else None
+            return self.records[item_id]
+
+    def set(self, item_id, key, value):
+        with self.lock:
+            record = self.get(item_id)
+            if record is None:
+                record = self.records[item_id] = {}
+            record[key] = value
+            self.dirty.add(item_id)
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return 0
+            rows = [(item_id, json.dumps(self.records[item_id])) for item_id in self.dirty]
+            with self.con:
+                self.con.executemany("INSERT OR REPLACE INTO museum_records VALUES (?, ?)", rows)
+            self.dirty.clear()
+            return len(rows)
+
+    def run_flusher(self, flush_interval):
+        while True:
+            time.sleep(flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to save museum records: {str(e)}")
+                traceback.print_tb(e.__traceback__)
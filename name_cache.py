@@ -0,0 +1,61 @@
+import time
+from threading import Lock
+
+import database
+import metrics
+
+NAME_TTL = 12 * 60 * 60
+
+
+class PlayerNameCache:
+    # uuid <-> name with a ttl, optionally backed by sqlite so restarts don't start cold
+    def __init__(self, path=None, ttl=NAME_TTL):
+        self.ttl = ttl
+        self.lock = Lock()
+        self.by_uuid = {}
+        self.by_name = {}
+        self.con = None
+        if path:
+            # self.lock only covers the dicts, so lookups don't wait behind someone else's transaction
+            self.con, self.db_lock = database.shared_connection(path)
+            with self.db_lock, self.con:
+                self.con.execute("CREATE TABLE IF NOT EXISTS player_names "
+                                 "(uuid TEXT PRIMARY KEY, name TEXT, fetched_at INTEGER)")
+                res = self.con.execute("SELECT uuid, name, fetched_at FROM player_names WHERE fetched_at > ?",
+                                       (int(time.time() - ttl),))
+                for uuid, name, fetched_at in res.fetchall():
+                    self.remember(name, uuid, fetched_at)
+
+    @staticmethod
+    def normalize_uuid(uuid):
+        return uuid.replace("-", "").lower()
+
+    def remember(self, name, uuid, fetched_at):
+        self.by_uuid[uuid] = (name, fetched_at)
+        self.by_name[name.lower()] = uuid
+
+    def get(self, input_name=None, input_uuid=None):
+        with self.lock:
+            if input_uuid:
+                uuid = self.normalize_uuid(input_uuid)
+            else:
+                uuid = self.by_name.get(input_name.lower())
+            entry = self.by_uuid.get(uuid)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                metrics.inc("cache_lookups_total", cache="player_names", result="miss")
+                return None
+            name = entry[0]
+            if input_name and name.lower() != input_name.lower():  # name has since moved to another player
+                metrics.inc("cache_lookups_total", cache="player_names", result="miss")
+                return None
+            metrics.inc("cache_lookups_total", cache="player_names", result="hit")
+            return name, uuid
+
+    def put(self, name, uuid):
+        uuid = self.normalize_uuid(uuid)
+        fetched_at = int(time.time())
+        with self.lock:
+            self.remember(name, uuid, fetched_at)
+        if self.con is not None:
+            with self.db_lock, self.con:
+                self.con.execute("INSERT OR REPLACE INTO player_names VALUES (?, ?, ?)", (uuid, name, fetched_at))
@@ -0,0 +1,155 @@
+import gzip
+import struct
+import zlib
+from base64 import b64decode
+
+TAG_END = 0
+TAG_BYTE = 1
+TAG_SHORT = 2
+TAG_INT = 3
+TAG_LONG = 4
+TAG_FLOAT = 5
+TAG_DOUBLE = 6
+TAG_BYTE_ARRAY = 7
+TAG_STRING = 8
+TAG_LIST = 9
+TAG_COMPOUND = 10
+TAG_INT_ARRAY = 11
+TAG_LONG_ARRAY = 12
+
+SCALAR_STRUCTS = {
+    TAG_BYTE: struct.Struct(">b"),
+    TAG_SHORT: struct.Struct(">h"),
+    TAG_INT: struct.Struct(">i"),
+    TAG_LONG: struct.Struct(">q"),
+    TAG_FLOAT: struct.Struct(">f"),
+    TAG_DOUBLE: struct.Struct(">d"),
+}
+ARRAY_ITEM_SIZES = {TAG_BYTE_ARRAY: 1, TAG_INT_ARRAY: 4, TAG_LONG_ARRAY: 8}
+ARRAY_ITEM_FORMATS = {TAG_BYTE_ARRAY: "B", TAG_INT_ARRAY: "i", TAG_LONG_ARRAY: "q"}
+FIXED_SIZES = {TAG_BYTE: 1, TAG_SHORT: 2, TAG_INT: 4, TAG_LONG: 8, TAG_FLOAT: 4, TAG_DOUBLE: 8}
+UNSIGNED_SHORT = struct.Struct(">H")
+SIGNED_INT = struct.Struct(">i")
+
+# every field find_items, the webhooks and exotics read. True keeps the whole value, a dict only keeps those children.
+# lists of compounds apply the dict to each element.
+ITEM_FIELDS = {
+    "id": True,
+    "tag": {
+        "ExtraAttributes": {
+            "id": True, "uuid": True, "timestamp": True, "modifier": True, "originTag": True, "winning_bid": True,
+            "party_hat_year": True, "raffle_win": True, "baseStatBoostPercentage": True, "item_tier": True,
+            "dye_item": True,
+        },
+        "display": {"color": True},
+    },
+}
+AUCTION_FIELDS = {"i": ITEM_FIELDS}
+# what PlayerScanner.get_inventory needs out of a whole inventory
+INVENTORY_FIELDS = {"i": {"tag": {"ExtraAttributes": {"id": True, "uuid": True}, "display": {"color": True}}}}
+
+
+def compile_fields(fields):
+    # names are compared as raw bytes so skipped tags never get decoded
+    return {name.encode(): (name, True if wanted is True else compile_fields(wanted)) for name, wanted in fields.items()}
+
+
+COMPILED_AUCTION_FIELDS = compile_fields(AUCTION_FIELDS)
+COMPILED_INVENTORY_FIELDS = compile_fields(INVENTORY_FIELDS)
+DECODE_ERRORS = (struct.error, IndexError, EOFError, OSError, zlib.error, UnicodeDecodeError)
+
+
+def read_item_bytes(item_bytes, fields=None):
+    return read_nbt(decompress(item_bytes), COMPILED_AUCTION_FIELDS if fields is None else compile_fields(fields))
+
+
+def decompress(item_bytes):
+    # base64 gzipped nbt -> raw nbt, split out so callers can search the raw bytes before parsing them
+    try:
+        return gzip.decompress(b64decode(item_bytes))
+    except DECODE_ERRORS as e:
+        raise ValueError(f"invalid nbt data: {e}") from e
+
+
+def read_nbt(data, compiled_fields):
+    # same shape as python_nbt's json_obj(full_json=False), minus everything not in the fields
+    try:
+        if data[0] != TAG_COMPOUND:
+            raise ValueError("root tag is not a compound")
+        name_length = UNSIGNED_SHORT.unpack_from(data, 1)[0]
+        return read_compound(data, 3 + name_length, compiled_fields)[0]
+    except DECODE_ERRORS as e:
+        raise ValueError(f"invalid nbt data: {e}") from e
+
+
+def read_compound(data, pos, fields):
+    result = {}
+    while True:
+        tag_type = data[pos]
+        if tag_type == TAG_END:
+            return result, pos + 1
+        name_length = UNSIGNED_SHORT.unpack_from(data, pos + 1)[0]
+        name_end = pos + 3 + name_length
+        name_bytes = data[pos + 3:name_end]
+        if fields is True:
+            result[name_bytes.decode("utf-8", errors="replace")], pos = read_payload(data, name_end, tag_type, True)
+            continue
+        wanted = fields.get(name_bytes)
+        if wanted is None:
+            pos = skip_payload(data, name_end, tag_type)
+        else:
+            name, child_fields = wanted
+            result[name], pos = read_payload(data, name_end, tag_type, child_fields)
+
+
+def read_payload(data, pos, tag_type, fields):
+    scalar = SCALAR_STRUCTS.get(tag_type)
+    if scalar is not None:
+        return scalar.unpack_from(data, pos)[0], pos + scalar.size
+    if tag_type == TAG_STRING:
+        length = UNSIGNED_SHORT.unpack_from(data, pos)[0]
+        return data[pos + 2:pos + 2 + length].decode("utf-8", errors="replace"), pos + 2 + length
+    if tag_type == TAG_COMPOUND:
+        return read_compound(data, pos, fields)
+    if tag_type == TAG_LIST:
+        item_type = data[pos]
+        length = SIGNED_INT.unpack_from(data, pos + 1)[0]
+        pos += 5
+        items = []
+        for _ in range(max(length, 0)):
+            item, pos = read_payload(data, pos, item_type, fields)
+            items.append(item)
+        return items, pos
+    if tag_type in ARRAY_ITEM_SIZES:
+        length = SIGNED_INT.unpack_from(data, pos)[0]
+        pos += 4
+        end = pos + length * ARRAY_ITEM_SIZES[tag_type]
+        return list(struct.unpack_from(f">{length}{ARRAY_ITEM_FORMATS[tag_type]}", data, pos)), end
+    raise ValueError(f"unknown tag type {tag_type}")
+
+
+def skip_payload(data, pos, tag_type):
+    size = FIXED_SIZES.get(tag_type)
+    if size is not None:
+        return pos + size
+    if tag_type == TAG_STRING:
+        return pos + 2 + UNSIGNED_SHORT.unpack_from(data, pos)[0]
+    if tag_type == TAG_COMPOUND:
+        while True:
+            child_type = data[pos]
+            if child_type == TAG_END:
+                return pos + 1
+            pos = skip_payload(data, pos + 3 + UNSIGNED_SHORT.unpack_from(data, pos + 1)[0], child_type)
+    if tag_type == TAG_LIST:
+        item_type = data[pos]
+        length = max(SIGNED_INT.unpack_from(data, pos + 1)[0], 0)
+        pos += 5
+        size = FIXED_SIZES.get(item_type)
+        if size is not None:
+            return pos + length * size
+        for _ in range(length):
+            pos = skip_payload(data, pos, item_type)
+        return pos
+    if tag_type in ARRAY_ITEM_SIZES:
+        return pos + 4 + SIGNED_INT.unpack_from(data, pos)[0] * ARRAY_ITEM_SIZES[tag_type]
+    raise ValueError(f"unknown tag type {tag_type}")
@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import color
+import startup_cache
+
+NEAREST_TABLE_PATH = "nearest_pieces.u8"
+NEAREST_TABLE_VERSION = 1
+MAGIC = b"SNPT"
+HEADER_SIZE = 64
+TOP_GROUPS = 3  # what the seymour embed and /closest_pieces show
+DEPTH = 5  # reference indexes kept per color and slot, room for a couple of pieces sharing a hex
+CANDIDATES = 64  # > every crystal + fairy piece that can be skipped + DEPTH, so the top 3 are always in here
+EMPTY = 255
+OVERFLOW = 254  # the top 3 needs more than DEPTH references, look it up the slow way
+SLOT_INDEXES = {item_id: i for i, item_id in enumerate(startup_cache.SEYMOUR_SLOTS)}
+
+_table = None
+_table_checked = False
+
+# set in each build worker by init_worker
+_references = None
+
+
+def read_header(path=NEAREST_TABLE_PATH):
+    try:
+        with open(path, "rb") as r:
+            header = r.read(HEADER_SIZE)
+    except FileNotFoundError:
+        return None
+    if len(header) != HEADER_SIZE or header[:4] != MAGIC:
+        return None
+    version, depth, slots = header[4], header[5], header[6]
+    if version != NEAREST_TABLE_VERSION or depth != DEPTH or slots != len(SLOT_INDEXES):
+        return None
+    return header[7:47].decode()
+
+
+def make_header(hexes_digest):
+    header = MAGIC + bytes((NEAREST_TABLE_VERSION, DEPTH, len(SLOT_INDEXES))) + hexes_digest.encode()
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def get_table(hexes_digest):
+    # only used if it was built from the same default_hexes.json, and against the lab table so the ranking is exactly
+    # what find_closest_skyblock_piece would come up with
+    global _table, _table_checked
+    if not _table_checked:
+        _table_checked = True
+        if read_header() == hexes_digest and color.get_lab_table() is not None:
+            _table = np.memmap(NEAREST_TABLE_PATH, dtype=np.uint8, mode="r", offset=HEADER_SIZE,
+                               shape=(len(SLOT_INDEXES), color.LAB_TABLE_SIZE, DEPTH))
+    return _table
+
+
+def lookup(item_id, hex_code, hexes_digest):
+    # palette indexes in ranked order covering the top 3 entries, None if the table can't answer
+    table = get_table(hexes_digest)
+    if table is None:
+        return None
+    row = table[SLOT_INDEXES[item_id], int(hex_code, 16)].tolist()
+    if row[0] == OVERFLOW:
+        return None
+    return [x for x in row if x != EMPTY]
+
+
+def init_worker(references):
+    global _references
+    _references = references
+
+
+def rank_chunk(start, stop):
+    # same ordering as rank_similarities: by similarity then palette index, only the closest crystal / fairy piece
+    # counts, equal similarities share an entry
+    union_labs, slots = _references
+    labs = color.get_lab_table()[start:stop].astype(np.float64)
+    similarity_matrix = color.compare_delta_e_2000_matrix(labs, union_labs)
+    results = []
+    for columns, is_crystal, is_fairy in slots:
+        similarities = similarity_matrix[:, columns]
+        candidates = np.argpartition(similarities, CANDIDATES - 1, axis=1)[:, :CANDIDATES]
+        candidate_sims = np.take_along_axis(similarities, candidates, axis=1)
+        order = np.lexsort((candidates, candidate_sims), axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_sims = np.take_along_axis(candidate_sims, order, axis=1)
+
+        crystal, fairy = is_crystal[candidates], is_fairy[candidates]
+        skipped = (crystal & (np.cumsum(crystal, axis=1) > 1)) | (fairy & (np.cumsum(fairy, axis=1) > 1))
+        candidate_sims = np.where(skipped, np.inf, candidate_sims)
+        order = np.lexsort((candidates, candidate_sims), axis=1)  # skipped pieces to the back, the rest stays put
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_sims = np.take_along_axis(candidate_sims, order, axis=1)
+
+        groups = np.zeros(candidates.shape, dtype=np.int64)
+        groups[:, 1:] = np.cumsum(candidate_sims[:, 1:] != candidate_sims[:, :-1], axis=1)
+        needed = (groups < TOP_GROUPS) & np.isfinite(candidate_sims)
+
+        rows = np.full((len(labs), DEPTH), EMPTY, dtype=np.uint8)
+        rows[:] = np.where(needed[:, :DEPTH], candidates[:, :DEPTH], EMPTY)
+        rows[needed.sum(axis=1) > DEPTH] = OVERFLOW
+        results.append(rows)
+    return start, stop, results
+
+
+def build_references(palettes):
+    # every slot shares the OTHER pieces, so the delta e maths runs once per distinct lab and each slot picks its columns
+    union = {}
+    slots = []
+    for item_id in startup_cache.SEYMOUR_SLOTS:
+        names, labs = palettes[item_id]
+        if len(names) > OVERFLOW:
+            raise ValueError(f"{item_id} has {len(names)} reference pieces, the table only fits {OVERFLOW}")
+        columns = np.array([union.setdefault(tuple(x), len(union)) for x in labs.tolist()], dtype=np.int64)
+        slots.append((columns, np.array([x.startswith("Crystal ") for x in names]),
+                      np.array([x.startswith("Fairy ") for x in names])))
+    return np.array(list(union), dtype=np.float64), slots
+
+
+def build_nearest_table(palettes, hexes_digest, path=NEAREST_TABLE_PATH, chunk_size=1 << 13, workers=None):
+    if not os.path.exists(color.LAB_TABLE_PATH):
+        print("Building the lab table first")
+        color.build_lab_table()
+
+    references = build_references(palettes)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as w:
+        w.write(make_header(hexes_digest))
+    table = np.memmap(temp_path, dtype=np.uint8, mode="r+", offset=HEADER_SIZE,
+                      shape=(len(SLOT_INDEXES), color.LAB_TABLE_SIZE, DEPTH))
+    starts = range(0, color.LAB_TABLE_SIZE, chunk_size)
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=init_worker,
+                             initargs=(references,)) as executor:
+        stops = [min(x + chunk_size, color.LAB_TABLE_SIZE) for x in starts]
+        for done, (start, stop, results) in enumerate(executor.map(rank_chunk, starts, stops), 1):
+            for slot, rows in enumerate(results):
+                table[slot, start:stop] = rows
+            if done % 256 == 0:
+                print(f"{done}/{len(starts)} chunks, {time.time() - start_time:.0f}s")
+    table.flush()
+    overflow = int(np.count_nonzero(table[:, :, 0] == OVERFLOW))
+    del table
+    os.replace(temp_path, path)
+    print(f"Nearest piece table built in {time.time() - start_time:.0f}s, {overflow} colors left to the slow path")
+
+
+def build_if_stale(force=False, workers=None):
+    startup = startup_cache.shared()
+    if not force and read_header() == startup.hexes_digest:
+        print("Nearest piece table is up to date with default_hexes.json")
+        return
+    build_nearest_table(startup.palettes, startup.hexes_digest, workers=workers)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["build_nearest_table"]:
+        build_if_stale(force="--force" in sys.argv)
+    else:
+        print("usage: python nearest_table.py build_nearest_table [--force]")
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import http_client
+import metrics
+
+POSITION_URL = "https://api.tem.cx/items/position"
+MAX_BATCH = 100
+BATCH_WINDOW = 0.05
+POSITION_TTL = 6 * 60 * 60
+MAX_CACHED = 50000
+LOOKUP_TIMEOUT = 15
+FAILURE_THRESHOLD = 3
+BREAKER_COOLDOWN = 5 * 60
+FAILED = object()
+
+
+class PositionLookup:
+    # (itemId, creation in ms) -> highest known position on iTEM. answers come out of a ttl'd lru first, the misses get
+    # coalesced into size capped batches on the http client loop. after a few failed batches in a row lookups go cache
+    # only for a while, so a slow iTEM costs us museum alerts instead of the whole auction scan
+    def __init__(self, http, max_batch=MAX_BATCH, batch_window=BATCH_WINDOW, ttl=POSITION_TTL, max_cached=MAX_CACHED,
+                 timeout=LOOKUP_TIMEOUT, failure_threshold=FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.http = http
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = Lock()
+        self.cache = OrderedDict()
+        self.failures = 0
+        self.open_until = 0
+        # only touched from the client loop
+        self.in_flight = {}
+        self.queued = []
+        self.flush_handle = None
+        self.tasks = set()
+
+    def cached(self, key, now):
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        position, fetched_at = entry
+        if now - fetched_at > self.ttl:
+            del self.cache[key]
+            return None
+        self.cache.move_to_end(key)
+        return position
+
+    def remember(self, positions, now):
+        for key, position in positions.items():
+            self.cache[key] = (position, now)
+            self.cache.move_to_end(key)
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+
+    def record_failure(self, now):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.open_until = now + self.cooldown
+            print(f"iTEM position lookups failed {self.failures} times in a row, going cache only for {self.cooldown}s")
+
+    def lookup(self, keys):
+        # returns whatever positions it could get, keys iTEM doesn't know (or couldn't answer in time) are left out
+        now = time.time()
+        positions = {}
+        misses = []
+        with self.lock:
+            for key in dict.fromkeys(keys):
+                position = self.cached(key, now)
+                if position is None:
+                    misses.append(key)
+                else:
+                    positions[key] = position
+            breaker_open = now < self.open_until
+        metrics.inc("cache_lookups_total", len(positions), cache="i_tem_positions", result="hit")
+        metrics.inc("cache_lookups_total", len(misses), cache="i_tem_positions", result="miss")
+        if not misses:
+            return positions
+        if breaker_open:
+            metrics.inc("i_tem_positions_skipped_total", len(misses))
+            print(f"Skipping {len(misses)} iTEM position lookups, circuit is open.")
+            return positions
+
+        future = self.http.submit(self.fetch(misses))
+        try:
+            fetched, failed = future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()  # batches already sent still finish and answer anyone else waiting on them
+            print(f"iTEM position lookup timed out after {self.timeout}s.")
+            fetched, failed = {}, True
+        with self.lock:
+            if failed:
+                self.record_failure(time.time())
+            else:
+                self.failures = 0
+        positions.update(fetched)
+        return positions
+
+    async def fetch(self, keys):
+        # joins batches already in flight for the same keys, queues the rest for the next flush
+        loop = asyncio.get_running_loop()
+        waiting = {}
+        for key in keys:
+            future = self.in_flight.get(key)
+            if future is None:
+                future = self.in_flight[key] = loop.create_future()
+                self.queued.append(key)
+            waiting[key] = future
+        if self.queued and self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_window, self.flush)
+        await asyncio.wait(waiting.values())  # unlike gather, being cancelled doesn't cancel the shared futures
+
+        positions = {}
+        failed = False
+        for key, future in waiting.items():
+            position = future.result()
+            if position is FAILED:
+                failed = True
+            elif position is not None:
+                positions[key] = position
+        return positions, failed
+
+    def flush(self):
+        self.flush_handle = None
+        queued, self.queued = self.queued, []
+        for i in range(0, len(queued), self.max_batch):
+            task = asyncio.ensure_future(self.post_batch(queued[i:i + self.max_batch]))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def post_batch(self, keys):
+        positions = FAILED
+        try:
+            post_data = json.dumps({"items": [{"itemId": item_id, "creation": creation} for item_id, creation in keys]})
+            position_data = await self.http.request_json("POST", POSITION_URL, post_data,
+                                                         endpoint=http_client.I_TEM_POSITIONS)
+            if position_data is not None:
+                positions = {}
+                for item in position_data['positions']:
+                    positions.setdefault((item['itemId'], item['creation']), item['highest'])
+                with self.lock:  # cached here so answers that show up after the caller gave up aren't wasted
+                    self.remember(positions, time.time())
+        except (KeyError, TypeError) as e:
+            print(f"Bad iTEM position response: {str(e)}")
+            positions = FAILED
+        finally:
+            for key in keys:
+                future = self.in_flight.pop(key)
+                future.set_result(FAILED if positions is FAILED else positions.get(key))
@@ -0,0 +1,91 @@
+import database
+
+MAX_AUCTION_AGE = 15 * 24 * 60 * 60 * 1000  # auctions last at most 14 days
+ENDED_GRACE = 60 * 60 * 1000  # ended auctions are remembered this long in case a sweep just missed them
+
+
+class SeenAuctionIndex:
+    # every auction uuid we've already looked at, so a refresh only decodes the ones that are actually new.
+    # entries are uuid -> [state, start, ended_at], times are in ms like the api's
+    def __init__(self, path=None, max_age=MAX_AUCTION_AGE, ended_grace=ENDED_GRACE):
+        self.max_age = max_age
+        self.ended_grace = ended_grace
+        self.auctions = {}
+        self.dirty = set()
+        self.removed = set()
+        self.begin_sweep()
+        self.con = None
+        if path:
+            self.con, self.lock = database.shared_connection(path)
+            with self.lock, self.con:
+                self.con.execute("CREATE TABLE IF NOT EXISTS seen_auctions "
+                                 "(uuid TEXT PRIMARY KEY, state INTEGER, start INTEGER, ended_at INTEGER)")
+                res = self.con.execute("SELECT uuid, state, start, ended_at FROM seen_auctions")
+                for uuid, state, start, ended_at in res.fetchall():
+                    self.auctions[uuid] = [state, start, ended_at]
+
+    def __len__(self):
+        return len(self.auctions)
+
+    @staticmethod
+    def auction_state(auction):
+        # changes whenever someone bids or the auction gets claimed, ints and bools hash the same in every process
+        return hash((auction.get('highest_bid_amount', 0), len(auction.get('bids', ())), bool(auction.get('claimed'))))
+
+    def begin_sweep(self):
+        self.sweep_uuids = set()
+        self.sweep_pages = 0
+        self.counts = {"new": 0, "updated": 0, "ended": 0}
+
+    def filter_new(self, auctions):
+        # records every auction on the page, returns the unclaimed ones we haven't seen before
+        if auctions:
+            self.sweep_pages += 1
+        new_auctions = []
+        for auction in auctions:
+            uuid = auction['uuid']
+            self.sweep_uuids.add(uuid)
+            state = self.auction_state(auction)
+            entry = self.auctions.get(uuid)
+            if entry is None:
+                self.auctions[uuid] = [state, auction['start'], None]
+                self.dirty.add(uuid)
+                self.counts["new"] += 1
+                if not auction['claimed']:
+                    new_auctions.append(auction)
+                continue
+            if entry[0] != state or entry[2] is not None:
+                entry[0] = state
+                entry[2] = None
+                self.dirty.add(uuid)
+                self.counts["updated"] += 1
+        return new_auctions
+
+    def end_sweep(self, now, total_pages=None):
+        # anything missing from a complete sweep has ended, partial sweeps only age things out
+        if total_pages is not None and self.sweep_pages >= total_pages:
+            for uuid, entry in self.auctions.items():
+                if entry[2] is None and uuid not in self.sweep_uuids:
+                    entry[2] = now
+                    self.dirty.add(uuid)
+                    self.counts["ended"] += 1
+
+        expired = [uuid for uuid, (_, start, ended_at) in self.auctions.items()
+                   if start < now - self.max_age or (ended_at is not None and ended_at < now - self.ended_grace)]
+        for uuid in expired:
+            del self.auctions[uuid]
+            self.dirty.discard(uuid)
+            self.removed.add(uuid)
+        self.save()
+        counts = self.counts
+        self.begin_sweep()
+        return counts
+
+    def save(self):
+        if self.con is not None:
+            with self.lock, self.con:
+                self.con.executemany("DELETE FROM seen_auctions WHERE uuid = ?", [(x,) for x in self.removed])
+                self.con.executemany("INSERT OR REPLACE INTO seen_auctions VALUES (?, ?, ?, ?)",
+                                     [(x, *self.auctions[x]) for x in self.dirty])
+        self.dirty.clear()
+        self.removed.clear()
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+import traceback
+from functools import lru_cache
+
+import numpy as np
+
+SNAPSHOT_PATH = "startup_snapshot.pickle"
+SNAPSHOT_VERSION = 1
+DEFAULT_HEXES_PATH = "default_hexes.json"
+ITEM_HASHES_URL = "https://raw.githubusercontent.com/Altpapier/Skyblock-Item-Emojis/main/v3/itemHash.json"
+HASH_IMAGES_URL = "https://raw.githubusercontent.com/Altpapier/Skyblock-Item-Emojis/main/v3/images.json"
+REVALIDATE_INTERVAL = 6 * 60 * 60
+SEYMOUR_SLOTS = ("VELVET_TOP_HAT", "CASHMERE_JACKET", "SATIN_TROUSERS", "OXFORD_SHOES")
+
+
+class StartupCache:
+    # everything main and exotics derive from default_hexes.json and the github item image maps, pickled into one
+    # file so a restart is a single read. the image maps are revalidated with etags in the background, the rest is
+    # rebuilt whenever default_hexes.json changes
+    def __init__(self, path=SNAPSHOT_PATH, hexes_path=DEFAULT_HEXES_PATH):
+        self.path = path
+        with open(hexes_path, "rb") as r:
+            hexes_bytes = r.read()
+        self.hexes_digest = hashlib.sha1(hexes_bytes).hexdigest()
+        snapshot = self.load()
+        if snapshot is None:
+            snapshot = {"version": SNAPSHOT_VERSION, "item_hashes": {}, "hash_images": {}, "validators": {},
+                        "item_images": {}}
+        if snapshot.get("hexes_digest") != self.hexes_digest:
+            self.build_hex_tables(snapshot, json.loads(hexes_bytes))
+            self.save(snapshot)
+        self.snapshot = snapshot
+        self.default_hexes = snapshot["default_hexes"]
+        self.palettes = snapshot["palettes"]
+        self.item_images = snapshot["item_images"]  # only ever updated in place, main holds on to this dict
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as r:
+                snapshot = pickle.load(r)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable startup snapshot: {str(e)}")
+            return None
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return None
+        return snapshot
+
+    def save(self, snapshot):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as w:
+            pickle.dump(snapshot, w, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+
+    def build_hex_tables(self, snapshot, default_hexes):
+        # palettes are (names, lab array) per slot, every slot also gets compared against the shared OTHER pieces
+        palettes = {}
+        for item_id in SEYMOUR_SLOTS:
+            references = {**default_hexes[item_id], **default_hexes["OTHER"]}
+            palettes[item_id] = ([x['name'] for x in references.values()],
+                                 np.array([x['lab'] for x in references.values()], dtype=np.float64))
+        snapshot["hexes_digest"] = self.hexes_digest
+        snapshot["default_hexes"] = default_hexes
+        snapshot["palettes"] = palettes
+
+    def revalidate_item_images(self, http):
+        # conditional gets, so an unchanged map costs a 304. returns whether item_images changed
+        changed = False
+        validators = self.snapshot["validators"]
+        for key, url in (("item_hashes", ITEM_HASHES_URL), ("hash_images", HASH_IMAGES_URL)):
+            etag, last_modified = validators.get(url, (None, None))
+            response = http.get_json_revalidated(url, etag, last_modified)
+            if response is None:
+                continue
+            status, body, etag, last_modified = response
+            if status == 304:
+                continue
+            if key == "hash_images":
+                body = {x: y['normal'] for x, y in body.items() if 'normal' in y}  # the rest is never used
+            self.snapshot[key] = body
+            validators[url] = (etag, last_modified)
+            changed = True
+        if not changed:
+            return False
+
+        item_images = {item_id: self.snapshot["hash_images"][item_hash]
+                       for item_id, item_hash in self.snapshot["item_hashes"].items()
+                       if item_hash in self.snapshot["hash_images"]}
+        self.item_images.update(item_images)
+        for item_id in set(self.item_images) - set(item_images):
+            self.item_images.pop(item_id, None)
+        self.save(self.snapshot)
+        print(f"Item images updated, {len(self.item_images)} items")
+        return True
+
+    def run_revalidator(self, http, interval=REVALIDATE_INTERVAL):
+        while True:
+            try:
+                self.revalidate_item_images(http)
+            except Exception as e:
+                print(f"Failed to revalidate item images: {str(e)}")
+                traceback.print_tb(e.__traceback__)
+            time.sleep(interval)
+
+
+@lru_cache(maxsize=None)
+def shared():
+    return StartupCache()
@@ -0,0 +1,103 @@
+import re
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from pytz import timezone
+
+EASTERN = timezone('US/Eastern')
+MEMO_SIZE = 1 << 16
+# "06/11/19 04:20 PM", and the glitched 24h "14/11/19 16:20". anything else goes through strptime
+FIXED_FORMAT = re.compile(r"([0-9]{2})/([0-9]{2})/([0-9]{2}) ([0-9]{2}):([0-9]{2})(?: ([AP]M))?")
+
+
+def build_dst_table(tz, first_year=2000, last_year=2037):
+    # naive local times where localize(...).dst() can flip, and what it is from there on. both sides of every utc
+    # transition are included so the skipped and repeated hours come out exactly like pytz has them
+    points = set()
+    transitions = tz._utc_transition_times  # noqa, pytz doesn't expose these
+    infos = tz._transition_info  # noqa
+    for i in range(1, len(transitions)):
+        if not first_year <= transitions[i].year <= last_year:
+            continue
+        points.add(transitions[i] + infos[i - 1][0])
+        points.add(transitions[i] + infos[i][0])
+    points = sorted(points)
+    return points, [tz.localize(x).dst() != timedelta(0) for x in points]
+
+
+DST_POINTS, DST_FLAGS = build_dst_table(EASTERN)
+
+
+def is_eastern_dst(museum_date):
+    if not DST_POINTS[0] <= museum_date < DST_POINTS[-1]:
+        return EASTERN.localize(museum_date).dst() != timedelta(0)
+    return DST_FLAGS[bisect_right(DST_POINTS, museum_date) - 1]
+
+
+def timestamp_to_museum_unix(timestamp, use_dst: bool = True):
+    if ":" not in timestamp:
+        unix_timestamp = int(timestamp) / 1000
+        if use_dst:
+            unix_timestamp -= 3600  # All Unix timestamps were created on June 11th/12th, no need to DST check!
+        return int(unix_timestamp), True
+    return date_to_museum_unix(timestamp, use_dst)
+
+
+@lru_cache(maxsize=MEMO_SIZE, typed=True)
+def date_to_museum_unix(timestamp, use_dst):
+    # dates only go down to the minute, so the same strings come up over and over across a sweep
+    parsed = parse_fixed(timestamp)
+    if parsed is None:
+        return strptime_museum_unix(timestamp, use_dst)
+    museum_date, glitched = parsed
+    if use_dst and is_eastern_dst(museum_date):
+        museum_date -= timedelta(hours=1)
+    return int(museum_date.timestamp()), glitched
+
+
+def parse_fixed(timestamp):
+    # same answers as the strptime formats below, None for anything it isn't sure about
+    match = FIXED_FORMAT.fullmatch(timestamp)
+    if match is None:
+        return None
+    month, day, year, hour, minute = map(int, match.group(1, 2, 3, 4, 5))
+    am_pm = match.group(6)
+    if am_pm is None:
+        year += 2000
+        while month > 12:
+            month -= 12
+            year += 1
+    else:
+        if not 1 <= month <= 12 or not 1 <= hour <= 12:
+            return None
+        year += 2000 if year < 69 else 1900  # strptime's %y pivot
+        hour = hour % 12 + (12 if am_pm == "PM" else 0)
+    try:
+        return datetime(year, month, day, hour, minute), am_pm is None
+    except ValueError:
+        return None
+
+
+def strptime_museum_unix(timestamp, use_dst):
+    if "AM" not in timestamp and "PM" not in timestamp:
+        glitched = True
+        month, day, year = list(map(int, timestamp[0:8].split("/")))
+        year += 2000
+
+        while month > 12:
+            month -= 12
+            year += 1
+
+        # actual_date = datetime.strptime(timestamp, "%d/%m/%y %H:%M")
+        museum_date = datetime.strptime(f"{month}/{day}/{year} {timestamp[9:]}", "%m/%d/%Y %H:%M")
+    else:
+        glitched = False
+        museum_date = datetime.strptime(timestamp, "%m/%d/%y %I:%M %p")
+
+    if use_dst:
+        fuck_hypixel = EASTERN.localize(museum_date).dst() != timedelta(0)
+        if fuck_hypixel:
+            museum_date -= timedelta(hours=1)
+
+    return int(museum_date.timestamp()), glitched
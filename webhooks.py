@@ -0,0 +1,152 @@
+import queue
+import time
+import traceback
+from threading import Thread
+
+from discord_webhook import DiscordWebhook
+
+import metrics
+
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000  # discord's limit on the text of all embeds in one message combined
+MAX_SEND_ATTEMPTS = 5
+SEND_TIMEOUT = 30
+
+
+class WebhookMessage:
+    def __init__(self, content=None, embed=None, file_bytes=None, file_name="armor_image.png", batchable=True,
+                 edit_of=None):
+        self.content = content
+        self.embed = embed
+        self.file_bytes = file_bytes
+        self.file_name = file_name
+        self.batchable = batchable  # messages that get edited later have to go out on their own
+        self.edit_of = edit_of
+        self.message_id = None
+        self.attachments = []
+
+
+def embed_length(embed):
+    # what discord counts towards MAX_EMBED_CHARS_PER_MESSAGE
+    if embed is None:
+        return 0
+    embed = embed if isinstance(embed, dict) else vars(embed)
+    length = len(embed.get("title") or "") + len(embed.get("description") or "")
+    length += len((embed.get("footer") or {}).get("text") or "") + len((embed.get("author") or {}).get("name") or "")
+    for field in embed.get("fields") or ():
+        length += len(field.get("name") or "") + len(field.get("value") or "")
+    return length
+
+
+class WebhookDispatcher:
+    # one queue and one worker thread per webhook, so each webhook keeps its own order and rate limit
+    def __init__(self, webhook_urls: dict[str, str]):
+        self.webhook_urls = webhook_urls
+        self.queues = {name: queue.Queue() for name in webhook_urls}
+        for name in webhook_urls:
+            Thread(target=self.run_worker, args=(name,), name=f"webhook-{name}", daemon=True).start()
+
+    def enqueue(self, webhook_name, content=None, embed=None, file_bytes=None, file_name="armor_image.png",
+                batchable=True):
+        message = WebhookMessage(content, embed, file_bytes, file_name, batchable)
+        self.queues[webhook_name].put(message)
+        return message
+
+    def enqueue_edit(self, webhook_name, original: WebhookMessage, content=None, embed=None):
+        # the queue is fifo, so the original is always sent (or given up on) before its edit comes up
+        self.queues[webhook_name].put(WebhookMessage(content, embed, batchable=False, edit_of=original))
+
+    def queue_sizes(self) -> dict[str, int]:
+        return {name: webhook_queue.qsize() for name, webhook_queue in self.queues.items()}
+
+    def join(self):
+        for webhook_queue in self.queues.values():
+            webhook_queue.join()
+
+    def run_worker(self, webhook_name):
+        webhook_queue = self.queues[webhook_name]
+        held = None
+        while True:
+            batch = [held or webhook_queue.get()]
+            held = None
+            embed_chars = embed_length(batch[0].embed)
+            while batch[0].batchable and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+                try:
+                    message = webhook_queue.get_nowait()
+                except queue.Empty:
+                    break
+                message_chars = embed_length(message.embed)
+                if not message.batchable or embed_chars + message_chars > MAX_EMBED_CHARS_PER_MESSAGE:
+                    held = message
+                    break
+                batch.append(message)
+                embed_chars += message_chars
+            try:
+                with metrics.timer("webhook_send_seconds", webhook=webhook_name):
+                    sent = self.send_batch(self.webhook_urls[webhook_name], batch)
+                metrics.inc("webhook_messages_total", sent, webhook=webhook_name)
+            except Exception as e:
+                print(f"Failed to send {len(batch)} message(s) to the {webhook_name} webhook: {str(e)}")
+                traceback.print_tb(e.__traceback__)
+            for _ in batch:
+                webhook_queue.task_done()
+
+    @staticmethod
+    def build_webhook(url, batch: list[WebhookMessage]):
+        webhook = DiscordWebhook(url, timeout=SEND_TIMEOUT)  # a hung request would stall this webhook's queue
+        contents = []
+        file_names = set()
+        for message in batch:
+            if message.content and message.content not in contents:
+                contents.append(message.content)
+            if message.embed:
+                webhook.add_embed(message.embed)
+            if message.file_bytes and message.file_name not in file_names:
+                file_names.add(message.file_name)
+                webhook.add_file(message.file_bytes, message.file_name)
+        if contents:
+            webhook.set_content(" ".join(contents))
+        return webhook
+
+    def send_batch(self, url, batch: list[WebhookMessage]):
+        # returns how many of the messages were delivered
+        original = batch[0].edit_of
+        if original is not None and original.message_id is None:
+            print("Can't edit a webhook message that was never sent.")
+            return 0
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            # files are dropped after every execute, so each attempt gets a fresh webhook
+            webhook = self.build_webhook(url, batch)
+            if original is None:
+                response = webhook.execute()
+            else:
+                webhook.id = original.message_id
+                webhook.attachments = original.attachments  # leaving these out would delete the thumbnail
+                response = webhook.edit()
+            if response.status_code == 429:
+                metrics.inc("webhook_rate_limited_total")
+                retry_after = response.headers.get("Retry-After")
+                try:
+                    retry_after = response.json().get("retry_after", retry_after)
+                except ValueError:
+                    pass
+                time.sleep(float(retry_after or 1) + 0.15)
+                continue
+            if response.status_code >= 500:
+                time.sleep(2 ** attempt)
+                continue
+            if not response.ok:
+                if len(batch) > 1:
+                    # one bad message shouldn't take the rest of the batch down with it
+                    print(f"Webhook rejected a batch of {len(batch)} ({response.status_code}), sending them one by one.")
+                    return sum(self.send_batch(url, [message]) for message in batch)
+                print(f"Webhook rejected a message ({response.status_code}): {response.text[:500]}")
+                return 0
+
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                time.sleep(float(response.headers.get("X-RateLimit-Reset-After", 1)))
+            for message in batch:
+                message.message_id, message.attachments = webhook.id, webhook.attachments
+            return len(batch)
+        print(f"Gave up sending {len(batch)} message(s) after {MAX_SEND_ATTEMPTS} attempts.")
+        return 0